@@ -0,0 +1,129 @@
+"""Compare prompt tokens per request: legacy stuffed prompt vs PromptBuilder.
+
+Run from Backend/app:
+
+    python -m benchmarks.prompt_token_benchmark [--requests 200] [--budget 600] [--tokenizer gpt2|gemini]
+
+Both prompts are rendered exactly as the chain sends them, with the question
+the service asks, and counted with a real tokenizer: GPT-2 via transformers
+by default, or Gemini's own token counter with --tokenizer gemini (needs
+GOOGLE_API_KEY). The ~4 characters/token estimate PromptBuilder budgets with
+is shown alongside. Retrieval is simulated with the other blocks of the same
+district so no embedding model is needed.
+"""
+import argparse
+import json
+import statistics
+
+from langchain_core.language_models import BaseLanguageModel, FakeListChatModel
+from langchain_core.prompts import PromptTemplate
+
+from services.prompt_builder import PromptBuilder, QA_TEMPLATE, QUESTION_TEMPLATE, estimate_tokens
+
+HINDI_RISK_LEVELS = {"Green": "हरा", "Yellow": "पीला", "Red": "लाल"}
+
+# The template and document layout used before PromptBuilder, kept for comparison
+LEGACY_TEMPLATE = """
+        You are an agricultural water management expert helping farmers in India.
+        Analyze the provided water data and context to provide insights in {language}.
+
+        Context Information:
+        {context}
+
+        User Question: {question}
+
+        Important Instructions:
+        1. Provide response in {language_name} language only
+        2. Use simple, farmer-friendly language that is easy to understand
+        3. Be empathetic and practical in your recommendations
+        4. Focus on water conservation and sustainable agricultural practices
+        5. Provide specific, actionable recommendations based on the risk level
+        6. Explain the implications of the water data in simple terms
+
+        Required JSON Response Format:
+        {{
+            "farmerMessage": "2-3 line simple message for farmers about current water situation and risk level",
+            "action": "1-2 line specific, actionable recommendation for water conservation and irrigation",
+            "explanation": "2-3 line technical explanation of water trends and concerns in simple terms"
+        }}
+
+        Remember: The response must be in pure {language_name} without any English words or code.
+        """
+
+
+def legacy_document(item):
+    return f"""
+                Location: {item['blockName']}, {item['district']}, {item['state']}
+                Rainfall: {item['rainfall']} mm
+                Groundwater Recharge: {item['groundwaterRecharge']} ham
+                Natural Discharges: {item['naturalDischarges']} ham
+                Annual Extractable: {item['annualExtractable']} ham
+                Groundwater Extraction: {item['groundwaterExtraction']} ham
+                Stage of Extraction: {item['stageOfExtraction']}%
+                Depth to Water: {item['depthToWater']} meters
+                Risk Level: {item['riskLevel']}
+                Coordinates: {item['latitude']}, {item['longitude']}
+                Last Updated: {item['lastUpdated']}
+                """.strip()
+
+
+def token_counter(tokenizer: str) -> BaseLanguageModel:
+    """Model whose get_num_tokens counts the prompt tokens"""
+    if tokenizer == "gemini":
+        from langchain_google_genai import ChatGoogleGenerativeAI
+
+        return ChatGoogleGenerativeAI(model="gemini-pro")
+    # Base language models count with the GPT-2 tokenizer from transformers
+    return FakeListChatModel(responses=[""])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data", default="data/sample_water_data.json")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--budget", type=int, default=600)
+    parser.add_argument("--tokenizer", choices=("gpt2", "gemini"), default="gpt2")
+    args = parser.parse_args()
+
+    with open(args.data, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    by_district = {}
+    for item in data:
+        by_district.setdefault(item["district"], []).append(item)
+
+    counter = token_counter(args.tokenizer)
+    legacy_prompt = PromptTemplate.from_template(LEGACY_TEMPLATE)
+    compact_prompt = PromptTemplate.from_template(QA_TEMPLATE)
+    builder = PromptBuilder(token_budget=args.budget)
+
+    tokens = {"legacy": [], "compact": []}
+    estimates = {"legacy": [], "compact": []}
+    for item in data[:args.requests]:
+        retrieved = [item] + [other for other in by_district[item["district"]] if other["id"] != item["id"]][:2]
+        # The same question the service sends, so only the template and context differ
+        question = QUESTION_TEMPLATE.format(risk_level=item["riskLevel"], risk_local=HINDI_RISK_LEVELS[item["riskLevel"]])
+
+        legacy_inputs = {
+            "context": "\n\n".join(legacy_document(r) for r in retrieved),
+            "question": question,
+            "language": "hi",
+            "language_name": "Hindi",
+        }
+        compact_inputs, _ = builder.build(item, retrieved, question, "Hindi")
+
+        for name, prompt, inputs in (("legacy", legacy_prompt, legacy_inputs), ("compact", compact_prompt, compact_inputs)):
+            text = prompt.invoke(inputs).to_string()
+            tokens[name].append(counter.get_num_tokens(text))
+            estimates[name].append(estimate_tokens(text))
+
+    print(f"{len(tokens['legacy'])} requests, budget={args.budget}, tokenizer={args.tokenizer}")
+    for name in ("legacy", "compact"):
+        print(
+            f"{name + ' prompt tokens:':<24}mean {statistics.mean(tokens[name]):.0f}, max {max(tokens[name])} "
+            f"(estimate mean {statistics.mean(estimates[name]):.0f})"
+        )
+    print(f"reduction: {100 * (1 - statistics.mean(tokens['compact']) / statistics.mean(tokens['legacy'])):.1f}%")
+
+
+if __name__ == "__main__":
+    main()
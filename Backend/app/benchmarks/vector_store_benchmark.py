@@ -0,0 +1,217 @@
+"""Compare the numpy and Chroma vector store backends on the sample water data.
+
+Run from Backend/app:
+
+    python -m benchmarks.vector_store_benchmark [--queries 200] [--k 5]
+
+Reports build/open time, query latency, recall@k against exact brute-force
+search, on-disk size, and resident memory (RSS) for each backend. Building
+and opening each run in a fresh process so native memory (Chroma's SQLite
+and hnswlib) is counted, and embeddings are computed up front so the model
+is not part of either measurement.
+"""
+import argparse
+import json
+import multiprocessing
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from services.vector_store import NumpyVectorStore, create_vector_store
+
+
+def load_documents(path: str):
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    documents = [
+        Document(
+            page_content=(
+                f"Location: {item['blockName']}, {item['district']}, {item['state']}\n"
+                f"Risk Level: {item['riskLevel']}\n"
+                f"Depth to Water: {item['depthToWater']} meters"
+            ),
+            metadata={
+                "id": item["id"],
+                "state": item["state"],
+                "district": item["district"],
+                "risk_level": item["riskLevel"],
+            },
+        )
+        for item in data
+    ]
+    queries = [f"{item['blockName']}, {item['district']}" for item in data]
+    return documents, queries
+
+
+class PrecomputedEmbeddings(Embeddings):
+    """Serves embeddings computed once in the parent, so child processes never load the model"""
+
+    def __init__(self, vectors: Dict[str, List[float]]):
+        self.vectors = vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self.vectors[text] for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.vectors[text]
+
+
+def directory_size(path: Path) -> int:
+    return sum(p.stat().st_size for p in path.rglob("*") if p.is_file())
+
+
+def peak_rss_kb() -> int:
+    """Peak resident memory of this process since start or the last reset"""
+    try:
+        for line in Path("/proc/self/status").read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1])
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes elsewhere
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def rss_baseline_kb(backend) -> int:
+    """Import the backend and reset the peak so only index memory is measured"""
+    # Imported before the baseline is taken so library code is not counted as index memory
+    if backend == "chroma":
+        import langchain_chroma  # noqa: F401
+    try:
+        # Linux resets the peak (VmHWM) to the current RSS; elsewhere the
+        # peak may include earlier allocations and the numbers are upper bounds
+        Path("/proc/self/clear_refs").write_text("5")
+    except OSError:
+        pass
+    return peak_rss_kb()
+
+
+def open_backend(backend, embeddings, persist_directory, quantize=False):
+    """Open a persisted store without re-adding documents"""
+    if backend == "chroma":
+        from langchain_chroma import Chroma
+
+        return Chroma(
+            persist_directory=persist_directory,
+            collection_name="bench",
+            embedding_function=embeddings
+        )
+    store = NumpyVectorStore(embeddings, persist_directory, "bench", quantize=quantize)
+    if not store.load():
+        raise RuntimeError(f"No persisted numpy index in {persist_directory}")
+    return store
+
+
+def build_in_child(backend, documents, embeddings, workdir, quantize):
+    """Build and persist a store; returns (seconds, RSS growth in KB)"""
+    baseline = rss_baseline_kb(backend)
+    start = time.perf_counter()
+    create_vector_store(backend, documents, embeddings, workdir, "bench", quantize=quantize)
+    return time.perf_counter() - start, peak_rss_kb() - baseline
+
+
+def open_and_query_in_child(backend, embeddings, workdir, quantize, query_vectors, k):
+    """Re-open a persisted store, as a restarted API process would, and query it"""
+    baseline = rss_baseline_kb(backend)
+    start = time.perf_counter()
+    store = open_backend(backend, embeddings, workdir, quantize=quantize)
+    open_time = time.perf_counter() - start
+    open_rss = peak_rss_kb() - baseline
+
+    latencies = []
+    results = []
+    for vector in query_vectors:
+        start = time.perf_counter()
+        docs = store.similarity_search_by_vector(vector.tolist(), k=k)
+        latencies.append(time.perf_counter() - start)
+        results.append([doc.metadata["id"] for doc in docs])
+
+    return {
+        "open_s": open_time,
+        "open_rss_kb": open_rss,
+        "serve_rss_kb": peak_rss_kb() - baseline,
+        "p50_ms": float(np.percentile(latencies, 50) * 1000),
+        "p95_ms": float(np.percentile(latencies, 95) * 1000),
+        "results": results,
+    }
+
+
+def run_in_fresh_process(func, *args):
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return pool.submit(func, *args).result()
+
+
+def run_backend(backend, documents, embeddings, query_vectors, k, quantize=False):
+    workdir = Path(tempfile.mkdtemp(prefix=f"bench_{backend}_"))
+    try:
+        build_time, build_rss = run_in_fresh_process(
+            build_in_child, backend, documents, embeddings, str(workdir), quantize
+        )
+        stats = run_in_fresh_process(
+            open_and_query_in_child, backend, embeddings, str(workdir), quantize, query_vectors, k
+        )
+        stats.update(build_s=build_time, build_rss_kb=build_rss, disk_kb=directory_size(workdir) / 1024)
+        return stats
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data", default="data/sample_water_data.json")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    # Imported here so the spawned benchmark processes do not load the model
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    documents, queries = load_documents(args.data)
+    model = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+
+    rng = np.random.default_rng(0)
+    queries = [queries[i] for i in rng.choice(len(queries), size=min(args.queries, len(queries)), replace=False)]
+    query_vectors = np.asarray(model.embed_documents(queries), dtype=np.float32)
+
+    texts = [d.page_content for d in documents]
+    text_vectors = model.embed_documents(texts)
+    embeddings = PrecomputedEmbeddings(dict(zip(texts, text_vectors)))
+
+    # Exact ground truth by brute force over float64 embeddings
+    doc_vectors = np.asarray(text_vectors, dtype=np.float64)
+    doc_vectors /= np.linalg.norm(doc_vectors, axis=1, keepdims=True)
+    ids = np.array([d.metadata["id"] for d in documents])
+    truth = [set(ids[np.argsort(-(doc_vectors @ q))[:args.k]]) for q in query_vectors]
+
+    runs = {
+        "numpy-float32": ("numpy", False),
+        "numpy-int8": ("numpy", True),
+        "chroma": ("chroma", False),
+    }
+    print(f"{len(documents)} documents, {len(queries)} queries, k={args.k}")
+    print(
+        f"{'backend':<15}{'recall':>8}{'build s':>10}{'open s':>9}{'p50 ms':>9}{'p95 ms':>9}"
+        f"{'disk KB':>10}{'build RSS':>11}{'open RSS':>10}{'serve RSS':>11}"
+    )
+    for name, (backend, quantize) in runs.items():
+        stats = run_backend(backend, documents, embeddings, query_vectors, args.k, quantize)
+        recall = np.mean([len(set(r) & t) / args.k for r, t in zip(stats["results"], truth)])
+        print(
+            f"{name:<15}{recall:>8.3f}{stats['build_s']:>10.2f}{stats['open_s']:>9.3f}"
+            f"{stats['p50_ms']:>9.3f}{stats['p95_ms']:>9.3f}{stats['disk_kb']:>10.0f}"
+            f"{stats['build_rss_kb']:>11}{stats['open_rss_kb']:>10}{stats['serve_rss_kb']:>11}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,16 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 import os
 from pathlib import Path
+from typing import Optional, List
 
-from models.water_models import WaterLevelRequest, WaterLevelResponse
+from models.water_models import WaterLevelRequest, WaterLevelResponse, WaterAnalysis, BlockLocateRequest, BlockLocateResponse
 from services.langchain_service import LangChainWaterSystem  # Updated import
 from services.tts_service import TextToSpeechService
+from services.map_cluster_service import MapClusterService, MapTooLargeError
+from services.profiling_service import ProfilingService
 
 app = FastAPI(
     title="Water Level Analysis API",
@@ -27,6 +30,34 @@ app.add_middleware(
 # Initialize services with LangChain
 water_system = LangChainWaterSystem()
 tts_service = TextToSpeechService()
+map_cluster_service = MapClusterService()
+profiling_service = ProfilingService(
+    enabled=os.getenv("PROFILING_ENABLED", "false").lower() == "true",
+    profile_dir=os.getenv("PROFILING_DIR", "profiles"),
+    sample_every=int(os.getenv("PROFILING_SAMPLE_EVERY", "0")),
+    max_profiles=int(os.getenv("PROFILING_MAX_PROFILES", "50")),
+    admin_token=os.getenv("ADMIN_TOKEN")
+)
+
+# The middleware is only installed when profiling is enabled, so a disabled
+# hook adds no per-request work at all
+if profiling_service.enabled:
+    @app.middleware("http")
+    async def profile_request(request: Request, call_next):
+        if request.url.path.startswith("/api/admin") or not profiling_service.should_profile(request.headers):
+            return await call_next(request)
+
+        sampler = profiling_service.start()
+        if sampler is None:
+            return await call_next(request)
+        try:
+            response = await call_next(request)
+        finally:
+            # Joining the sampler thread and writing files must not block other requests
+            await profiling_service.stop_async(sampler)
+        profile_id = await profiling_service.save_async(sampler, request.method, request.url.path, response.status_code)
+        response.headers["X-Profile-Id"] = profile_id
+        return response
 
 # Create directories
 Path("audio_cache").mkdir(exist_ok=True)
@@ -39,30 +70,149 @@ app.mount("/audio", StaticFiles(directory="audio_cache"), name="audio")
 async def startup_event():
     """Initialize services on startup"""
     await water_system.initialize()
+    map_cluster_service.build(water_system.data)
     print("✅ LangChain Water Level API started successfully")
 
-@app.post("/api/water-level", response_model=WaterLevelResponse)
-async def get_water_level_analysis(request: WaterLevelRequest):
-    """
-    Get water level analysis using LangChain RAG pipeline
-    """
+def _parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    """Parse a comma-separated fields= projection over WaterAnalysis"""
+    if not fields:
+        return None
+    field_list = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in field_list if f not in WaterAnalysis.model_fields]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return field_list
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    return if_none_match.strip() == "*" or etag in [t.strip() for t in if_none_match.split(",")]
+
+async def _water_level_response(body: WaterLevelRequest, request: Request, fields: Optional[str], conditional: bool):
+    has_coordinates = body.latitude is not None and body.longitude is not None
+    if not has_coordinates and not body.location:
+        raise HTTPException(status_code=400, detail="Provide latitude/longitude or a location")
+    field_list = _parse_fields(fields)
+
     try:
+        # Resolve the block first so a repeat view can be answered before the LLM runs
+        resolved = await water_system.resolve_block(body.location, body.latitude, body.longitude)
+        etag = water_system.analysis_etag(resolved[0], body.language, field_list)
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        if conditional and _etag_matches(request, etag):
+            return Response(status_code=304, headers=headers)
+
         water_data = await water_system.get_water_analysis(
-            location=request.location,
-            latitude=request.latitude,
-            longitude=request.longitude,
-            language=request.language
+            location=body.location,
+            latitude=body.latitude,
+            longitude=body.longitude,
+            language=body.language,
+            resolved=resolved
         )
         
-        return WaterLevelResponse(
+        response = WaterLevelResponse(
             success=True,
-            data=water_data,
+            data=WaterAnalysis(**water_data),
             message="Water level analysis completed successfully"
         )
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing request: {str(e)}")
 
+    # Canned fallback insights must not be revalidated as if they were the real answer
+    if not response.data.aiGenerated:
+        headers = {"Cache-Control": "no-store"}
+
+    include = {"success": True, "message": True, "data": set(field_list)} if field_list else None
+    return ORJSONResponse(response.model_dump(include=include), headers=headers)
+
+@app.post("/api/water-level", response_model=WaterLevelResponse)
+async def get_water_level_analysis(body: WaterLevelRequest, request: Request, fields: Optional[str] = None):
+    """
+    Get water level analysis using LangChain RAG pipeline.
+    The block is resolved from latitude/longitude when given, else from location text.
+    fields= optionally limits data to a comma-separated list of fields.
+    """
+    return await _water_level_response(body, request, fields, conditional=False)
+
+@app.get("/api/water-level", response_model=WaterLevelResponse)
+async def get_water_level_analysis_cached(
+    request: Request,
+    location: Optional[str] = None,
+    latitude: Optional[float] = Query(None, ge=-90, le=90),
+    longitude: Optional[float] = Query(None, ge=-180, le=180),
+    language: str = "hi",
+    fields: Optional[str] = None
+):
+    """
+    Same analysis as POST /api/water-level as a conditional GET: send the
+    returned ETag in If-None-Match to get 304 without rerunning the pipeline.
+    """
+    body = WaterLevelRequest(location=location, latitude=latitude, longitude=longitude, language=language)
+    return await _water_level_response(body, request, fields, conditional=True)
+
+@app.post("/api/blocks/locate", response_model=BlockLocateResponse)
+async def locate_blocks(request: BlockLocateRequest):
+    """Resolve many GPS points to water blocks in one index lookup"""
+    matches = water_system.locate_blocks(
+        [p.latitude for p in request.points],
+        [p.longitude for p in request.points]
+    )
+    return BlockLocateResponse(success=True, data=matches)
+
+@app.get("/api/map/clusters")
+async def get_map_clusters(request: Request, bbox: str, zoom: int):
+    """
+    Get clustered blocks for a map viewport as GeoJSON.
+    bbox is "west,south,east,north" in degrees.
+    """
+    try:
+        west, south, east, north = (float(v) for v in bbox.split(","))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="bbox must be 'west,south,east,north'")
+    if not 0 <= zoom <= 22 or west > east or south > north:
+        raise HTTPException(status_code=400, detail="Invalid bbox or zoom")
+
+    bounds = (west, south, east, north)
+    etag = map_cluster_service.etag(bounds, zoom)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    try:
+        content = map_cluster_service.render(bounds, zoom)
+    except MapTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+    return Response(
+        content=content,
+        media_type="application/geo+json",
+        headers=headers
+    )
+
+def _check_admin(request: Request):
+    if not profiling_service.enabled:
+        raise HTTPException(status_code=404, detail="Profiling is disabled")
+    if not profiling_service.is_authorized(request.headers):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+@app.get("/api/admin/profiles")
+async def list_profiles(request: Request):
+    """List stored request profiles, newest first"""
+    _check_admin(request)
+    return {"success": True, "profiles": profiling_service.list_profiles()}
+
+@app.get("/api/admin/profiles/{profile_id}")
+async def download_profile(request: Request, profile_id: str, format: str = "speedscope"):
+    """Download a profile as speedscope JSON or collapsed stacks (format=collapsed)"""
+    _check_admin(request)
+    path = profiling_service.profile_path(profile_id, format)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    media_type = "application/json" if format == "speedscope" else "text/plain"
+    return FileResponse(path, media_type=media_type, filename=path.name)
+
 @app.get("/api/audio/{audio_id}")
 async def get_audio_file(audio_id: str):
     """Serve generated audio files"""
@@ -1,16 +1,33 @@
 from pydantic import BaseModel, Field
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, List
 
 class WaterLevelRequest(BaseModel):
-    location: str = Field(..., description="Location name for water level analysis")
-    latitude: float = Field(..., description="Latitude coordinate")
-    longitude: float = Field(..., description="Longitude coordinate")
+    location: Optional[str] = Field(None, description="Location name, used when coordinates are missing or unmatched")
+    latitude: Optional[float] = Field(None, ge=-90, le=90, description="Latitude coordinate")
+    longitude: Optional[float] = Field(None, ge=-180, le=180, description="Longitude coordinate")
     language: str = Field("hi", description="Language code: 'hi' for Hindi, 'pa' for Punjabi")
 
-class WaterLevelResponse(BaseModel):
+class Coordinate(BaseModel):
+    latitude: float = Field(..., ge=-90, le=90, description="Latitude coordinate")
+    longitude: float = Field(..., ge=-180, le=180, description="Longitude coordinate")
+
+class BlockLocateRequest(BaseModel):
+    points: List[Coordinate] = Field(..., description="Points to resolve to water blocks")
+
+class BlockMatch(BaseModel):
+    latitude: float
+    longitude: float
+    id: Optional[int] = None
+    blockName: Optional[str] = None
+    district: Optional[str] = None
+    state: Optional[str] = None
+    riskLevel: Optional[str] = None
+    method: Optional[str] = None
+    distanceKm: Optional[float] = None
+
+class BlockLocateResponse(BaseModel):
     success: bool
-    data: Dict[str, Any]
-    message: str
+    data: List[BlockMatch]
 
 class WaterData(BaseModel):
     id: int
@@ -32,4 +49,20 @@ class WaterData(BaseModel):
 class AIInsights(BaseModel):
     farmerMessage: str
     action: str
-    explanation: str
\ No newline at end of file
+    explanation: str
+
+class WaterAnalysis(WaterData, AIInsights):
+    location: Optional[str] = None
+    searchedLatitude: Optional[float] = None
+    searchedLongitude: Optional[float] = None
+    matchedLocation: str
+    matchMethod: Optional[str] = None
+    confidenceScore: float
+    dataSource: str
+    promptStats: Optional[Dict[str, int]] = None
+    aiGenerated: bool = True
+
+class WaterLevelResponse(BaseModel):
+    success: bool
+    data: WaterAnalysis
+    message: str
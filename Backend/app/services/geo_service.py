@@ -0,0 +1,137 @@
+import json
+import logging
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+
+import numpy as np
+import shapely
+from shapely.geometry import shape
+from shapely.strtree import STRtree
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6371.0
+
+
+class BlockLocator:
+    """Resolves GPS coordinates to water blocks with Shapely STRtrees.
+
+    Block boundary polygons (GeoJSON features whose properties carry the block
+    "id") are indexed once; a point is matched to the polygon containing it
+    or touching it, so a pin on a shared edge still resolves. Points outside every polygon, or all points when no boundary file is
+    available, fall back to the nearest block centroid within max_distance_km.
+    """
+
+    def __init__(self, max_distance_km: float = 50.0):
+        self.max_distance_km = max_distance_km
+        self.record_ids: np.ndarray = np.array([], dtype=np.int64)
+        self.centroid_lats: np.ndarray = np.array([])
+        self.centroid_lngs: np.ndarray = np.array([])
+        self.centroid_tree: Optional[STRtree] = None
+        self.polygon_ids: np.ndarray = np.array([], dtype=np.int64)
+        self.polygon_tree: Optional[STRtree] = None
+
+    def build(self, records: List[Dict[str, Any]], boundaries_path: Optional[str] = None):
+        """Index block centroids and, if available, block boundary polygons"""
+        self.record_ids = np.array([r["id"] for r in records], dtype=np.int64)
+        self.centroid_lats = np.array([r["latitude"] for r in records], dtype=np.float64)
+        self.centroid_lngs = np.array([r["longitude"] for r in records], dtype=np.float64)
+        self.centroid_tree = STRtree(shapely.points(self.centroid_lngs, self.centroid_lats))
+
+        self.polygon_tree = None
+        if boundaries_path and Path(boundaries_path).exists():
+            with open(boundaries_path, "r", encoding="utf-8") as f:
+                features = json.load(f).get("features", [])
+            known_ids = set(self.record_ids.tolist())
+            polygons, ids = [], []
+            for feature in features:
+                block_id = feature.get("properties", {}).get("id")
+                if block_id in known_ids and feature.get("geometry"):
+                    polygons.append(shape(feature["geometry"]))
+                    ids.append(block_id)
+            if polygons:
+                self.polygon_ids = np.array(ids, dtype=np.int64)
+                self.polygon_tree = STRtree(polygons)
+            logger.info(f"✅ Indexed {len(polygons)} block boundaries from {boundaries_path}")
+        else:
+            logger.info("ℹ️ No block boundary file found, using nearest-centroid lookup only")
+
+        logger.info(f"✅ Indexed {len(self.record_ids)} block centroids")
+
+    def _haversine_km(self, lats: np.ndarray, lngs: np.ndarray, idx: np.ndarray) -> np.ndarray:
+        lat1, lng1 = np.radians(lats), np.radians(lngs)
+        lat2, lng2 = np.radians(self.centroid_lats[idx]), np.radians(self.centroid_lngs[idx])
+        a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+        return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+    def _nearest_centroids(self, lats: np.ndarray, lngs: np.ndarray) -> List[Tuple[Optional[int], float]]:
+        """Great-circle nearest centroid within max_distance_km for each point.
+
+        The STRtree works in degrees, where a degree of longitude is shorter
+        than one of latitude, so its nearest hit is only a candidate. Its
+        haversine distance bounds a lat/lng box that must contain the true
+        nearest centroid; every centroid in that box is re-ranked by haversine.
+        """
+        nearest: List[Tuple[Optional[int], float]] = [(None, float("inf"))] * len(lats)
+        points = shapely.points(lngs, lats)
+        # query_nearest skips empty (NaN) points, so map candidates back by input index
+        input_idx, candidates = self.centroid_tree.query_nearest(points, all_matches=False)
+        if not len(input_idx):
+            return nearest
+        box_lats, box_lngs = lats[input_idx], lngs[input_idx]
+        radius_km = np.minimum(self._haversine_km(box_lats, box_lngs, candidates), self.max_distance_km) * 1.001
+        dlat = np.degrees(radius_km / EARTH_RADIUS_KM)
+        # Longitude degrees shrink towards the poles, so widen by the box's highest latitude
+        cos_lat = np.cos(np.radians(np.minimum(np.abs(box_lats) + dlat, 89.9)))
+        dlng = dlat / cos_lat
+        boxes = shapely.box(box_lngs - dlng, box_lats - dlat, box_lngs + dlng, box_lats + dlat)
+
+        box_idx, centroid_idx = self.centroid_tree.query(boxes)
+        point_idx = input_idx[box_idx]
+        distances = self._haversine_km(lats[point_idx], lngs[point_idx], centroid_idx)
+        within = distances <= self.max_distance_km
+        point_idx, centroid_idx, distances = point_idx[within], centroid_idx[within], distances[within]
+
+        order = np.lexsort((distances, point_idx))
+        point_idx, centroid_idx, distances = point_idx[order], centroid_idx[order], distances[order]
+        first = np.ones(len(point_idx), dtype=bool)
+        first[1:] = point_idx[1:] != point_idx[:-1]
+        for p, c, d in zip(point_idx[first].tolist(), centroid_idx[first].tolist(), distances[first].tolist()):
+            nearest[p] = (c, d)
+        return nearest
+
+    def locate_many(self, latitudes: Sequence[float], longitudes: Sequence[float]) -> List[Optional[Dict[str, Any]]]:
+        """Resolve many points at once.
+
+        Returns one entry per point: {"id", "method", "distance_km"} where
+        method is "polygon" or "nearest", or None if no block is close enough.
+        """
+        lats = np.asarray(latitudes, dtype=np.float64)
+        lngs = np.asarray(longitudes, dtype=np.float64)
+        results: List[Optional[Dict[str, Any]]] = [None] * len(lats)
+        if self.centroid_tree is None or not len(lats):
+            return results
+
+        points = shapely.points(lngs, lats)
+        unresolved = np.ones(len(lats), dtype=bool)
+
+        if self.polygon_tree is not None:
+            # "intersects" so a pin exactly on a shared edge still matches a block
+            point_idx, polygon_idx = self.polygon_tree.query(points, predicate="intersects")
+            for p, g in zip(point_idx.tolist(), polygon_idx.tolist()):
+                if unresolved[p]:
+                    results[p] = {"id": int(self.polygon_ids[g]), "method": "polygon", "distance_km": 0.0}
+                    unresolved[p] = False
+
+        if unresolved.any():
+            remaining = np.flatnonzero(unresolved)
+            nearest = self._nearest_centroids(lats[remaining], lngs[remaining])
+            for p, (c, d) in zip(remaining.tolist(), nearest):
+                if c is not None:
+                    results[p] = {"id": int(self.record_ids[c]), "method": "nearest", "distance_km": round(d, 3)}
+
+        return results
+
+    def locate(self, latitude: float, longitude: float) -> Optional[Dict[str, Any]]:
+        """Resolve a single point; see locate_many"""
+        return self.locate_many([latitude], [longitude])[0]
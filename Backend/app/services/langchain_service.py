@@ -9,12 +9,12 @@ import os
 from dotenv import load_dotenv
 import asyncio
 import logging
+import hashlib
 
 # LangChain imports
 from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
 from langchain_core.documents import Document
 from langchain_huggingface import HuggingFaceEmbeddings  # Or use sentence-transformers directly
-from langchain_chroma import Chroma
 from langchain_core.prompts import PromptTemplate
 from langchain.chains import create_retrieval_chain
 from langchain.chains.combine_documents import create_stuff_documents_chain
@@ -22,6 +22,10 @@ from langchain.memory import ConversationBufferMemory
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 
 from models.water_models import WaterData
+from services.vector_store import create_vector_store
+from services.prompt_builder import PromptBuilder, QA_TEMPLATE, QUESTION_TEMPLATE
+from services.geo_service import BlockLocator
+from services.profiling_service import run_in_executor
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -39,14 +43,26 @@ class LangChainWaterSystem:
         self.memory = None
         self.locations_list = []
         self.collection_name = "water_level_data"
-        self.persist_directory = "chroma_db"
+        # "numpy" (in-process mmap index) or "chroma"
+        self.vector_store_backend = os.getenv("VECTOR_STORE_BACKEND", "numpy").lower()
+        self.vector_store_quantize = os.getenv("VECTOR_STORE_QUANTIZE", "false").lower() == "true"
+        self.persist_directory = "chroma_db" if self.vector_store_backend == "chroma" else "vector_db"
+        self.records_by_id = {}
+        self.retrieval_k = int(os.getenv("RETRIEVAL_K", "4"))
+        self.prompt_builder = PromptBuilder(
+            token_budget=int(os.getenv("PROMPT_TOKEN_BUDGET", "600")),
+            max_neighbours=self.retrieval_k - 1
+        )
+        self.boundaries_path = os.getenv("BLOCK_BOUNDARIES_PATH", "data/block_boundaries.geojson")
+        self.block_locator = BlockLocator(max_distance_km=float(os.getenv("BLOCK_MAX_DISTANCE_KM", "50")))
         
     async def initialize(self):
-        """Initialize the LangChain RAG system with ChromaDB"""
+        """Initialize the LangChain RAG system with the configured vector store"""
         await self.load_sample_data()
+        self.block_locator.build(self.data, self.boundaries_path)
         await self.initialize_langchain()
         await self.initialize_chroma_vectorstore()
-        logger.info("✅ LangChain RAG System with ChromaDB initialized successfully")
+        logger.info(f"✅ LangChain RAG System with {self.vector_store_backend} vector store initialized successfully")
     
     async def initialize_langchain(self):
         """Initialize LangChain components with Google Gemini"""
@@ -89,6 +105,8 @@ class LangChainWaterSystem:
             content = await f.read()
             self.data = json.loads(content)
         
+        self.records_by_id = {item["id"]: item for item in self.data}
+        
         # Create location strings for matching
         self.locations_list = [
             f"{item['blockName']}, {item['district']}, {item['state']}" 
@@ -212,7 +230,7 @@ class LangChainWaterSystem:
         return sample_data
     
     async def initialize_chroma_vectorstore(self):
-        """Initialize Chroma vector store with water data"""
+        """Initialize the vector store (numpy or Chroma) with water data"""
         try:
             # Convert water data to LangChain documents
             documents = []
@@ -248,76 +266,37 @@ class LangChainWaterSystem:
                 )
                 documents.append(document)
             
-            # Create or load Chroma vector store
-            self.vector_store = Chroma.from_documents(
+            # Create or load the configured vector store backend
+            self.vector_store = create_vector_store(
+                backend=self.vector_store_backend,
                 documents=documents,
                 embedding=self.embeddings,
                 persist_directory=self.persist_directory,
-                collection_name=self.collection_name
+                collection_name=self.collection_name,
+                quantize=self.vector_store_quantize
             )
             
-            # Persist the database
-            self.vector_store.persist()
-            
-            # Create QA chain with custom prompt
-            prompt_template = self._create_qa_prompt()
-            
-            # Create retrieval QA chain
-            self.qa_chain = RetrievalQA.from_chain_type(
-                llm=self.llm,
-                chain_type="stuff",
-                retriever=self.vector_store.as_retriever(
-                    search_type="similarity",
-                    search_kwargs={"k": 3}
-                ),
-                chain_type_kwargs={"prompt": prompt_template},
-                return_source_documents=True
-            )
+            # Retrieval happens in generate_langchain_insights so the context
+            # can be assembled under the prompt token budget
+            self.qa_chain = self._create_qa_prompt() | self.llm
             
-            logger.info("✅ Chroma vector store and QA chain initialized")
+            logger.info(f"✅ {self.vector_store_backend} vector store and QA chain initialized")
             
         except Exception as e:
-            logger.error(f"❌ Failed to initialize Chroma vector store: {str(e)}")
+            logger.error(f"❌ Failed to initialize {self.vector_store_backend} vector store: {str(e)}")
             raise
     
     def _create_qa_prompt(self):
         """Create custom prompt template for water analysis"""
-        template = """
-        You are an agricultural water management expert helping farmers in India. 
-        Analyze the provided water data and context to provide insights in {language}.
-
-        Context Information:
-        {context}
-
-        User Question: {question}
-
-        Important Instructions:
-        1. Provide response in {language_name} language only
-        2. Use simple, farmer-friendly language that is easy to understand
-        3. Be empathetic and practical in your recommendations
-        4. Focus on water conservation and sustainable agricultural practices
-        5. Provide specific, actionable recommendations based on the risk level
-        6. Explain the implications of the water data in simple terms
-
-        Required JSON Response Format:
-        {{
-            "farmerMessage": "2-3 line simple message for farmers about current water situation and risk level",
-            "action": "1-2 line specific, actionable recommendation for water conservation and irrigation", 
-            "explanation": "2-3 line technical explanation of water trends and concerns in simple terms"
-        }}
-
-        Remember: The response must be in pure {language_name} without any English words or code.
-        """
-
         return PromptTemplate(
-            template=template,
-            input_variables=["context", "question", "language", "language_name"]
+            template=QA_TEMPLATE,
+            input_variables=["context", "question", "language_name"]
         )
     
     async def find_similar_locations(self, query: str, k: int = 5):
-        """Find similar locations using ChromaDB semantic search"""
+        """Find similar locations using vector store semantic search"""
         try:
-            # Use ChromaDB for similarity search
+            # Use the configured vector store for similarity search
             similar_docs = self.vector_store.similarity_search(query, k=k)
             
             similar_locations = []
@@ -337,7 +316,7 @@ class LangChainWaterSystem:
             return similar_locations
             
         except Exception as e:
-            logger.error(f"❌ ChromaDB semantic search failed: {str(e)}")
+            logger.error(f"❌ {self.vector_store_backend} semantic search failed: {str(e)}")
             # Fallback to fuzzy matching
             return await self._fuzzy_location_search(query, k)
     
@@ -380,20 +359,82 @@ class LangChainWaterSystem:
         
         return similar_locations
     
-    async def get_water_analysis(self, location: str, latitude: float, longitude: float, language: str = "hi"):
-        """Get comprehensive water analysis using LangChain RAG pipeline with ChromaDB"""
+    def resolve_block_by_coordinates(self, latitude: float, longitude: float) -> Optional[Dict[str, Any]]:
+        """Resolve a GPS point to a block record via the STRtree index"""
+        match = self.block_locator.locate(latitude, longitude)
+        if match is None:
+            return None
+        if match["method"] == "polygon":
+            similarity_score = 1.0
+        else:
+            similarity_score = max(0.0, 1 - match["distance_km"] / self.block_locator.max_distance_km)
+        return {
+            **self.records_by_id[match["id"]],
+            "similarity_score": similarity_score,
+            "distance_km": match["distance_km"],
+            "matchMethod": match["method"]
+        }
+    
+    def locate_blocks(self, latitudes: List[float], longitudes: List[float]) -> List[Dict[str, Any]]:
+        """Batch-resolve GPS points to block summaries"""
+        results = []
+        for lat, lng, match in zip(latitudes, longitudes, self.block_locator.locate_many(latitudes, longitudes)):
+            result = {"latitude": lat, "longitude": lng}
+            if match:
+                record = self.records_by_id[match["id"]]
+                result.update({
+                    "id": record["id"],
+                    "blockName": record["blockName"],
+                    "district": record["district"],
+                    "state": record["state"],
+                    "riskLevel": record["riskLevel"],
+                    "method": match["method"],
+                    "distanceKm": match["distance_km"]
+                })
+            results.append(result)
+        return results
+    
+    async def resolve_block(self, location: Optional[str], latitude: Optional[float], longitude: Optional[float]):
+        """Pick the block for a request, by coordinates first and location text second.
+        
+        Returns (block record with similarity_score, data source label).
+        """
+        # A GPS pin is resolved with an index lookup, no embedding call needed
+        if latitude is not None and longitude is not None:
+            best_match = self.resolve_block_by_coordinates(latitude, longitude)
+            if best_match:
+                return best_match, "Coordinate lookup"
+        
+        if not location:
+            raise ValueError(f"❌ No water data found near coordinates: {latitude}, {longitude}")
+        
+        # Find similar locations using the vector store
+        similar_locations = await self.find_similar_locations(location)
+        
+        if not similar_locations:
+            raise ValueError(f"❌ No water data found for location: {location}")
+        
+        # Use the most similar location
+        best_match = max(similar_locations, key=lambda x: x.get('similarity_score', 0))
+        return best_match, f"{self.vector_store_backend} RAG System"
+    
+    @staticmethod
+    def analysis_etag(record: Dict[str, Any], language: str, fields: Optional[List[str]] = None) -> str:
+        """ETag for an analysis; insights only change with the block data and language"""
+        projection = ",".join(sorted(fields)) if fields else "*"
+        digest = hashlib.sha1(f"{record['id']}|{record['lastUpdated']}|{language}|{projection}".encode("utf-8")).hexdigest()
+        return f'W/"{digest[:16]}"'
+    
+    async def get_water_analysis(self, location: Optional[str], latitude: Optional[float], longitude: Optional[float], language: str = "hi", resolved=None):
+        """Get comprehensive water analysis, resolving the block by coordinates first.
+        
+        resolved may carry a (record, data source) pair from resolve_block to skip resolution.
+        """
         try:
-            # Find similar locations using ChromaDB
-            similar_locations = await self.find_similar_locations(location)
-            
-            if not similar_locations:
-                raise ValueError(f"❌ No water data found for location: {location}")
-            
-            # Use the most similar location
-            best_match = max(similar_locations, key=lambda x: x.get('similarity_score', 0))
+            best_match, data_source = resolved or await self.resolve_block(location, latitude, longitude)
             
             # Generate AI-powered insights using LangChain RAG
-            ai_insights = await self.generate_langchain_insights(best_match, language)
+            ai_insights, prompt_stats, ai_generated = await self.generate_langchain_insights(best_match, language)
             
             return {
                 **best_match,
@@ -403,7 +444,9 @@ class LangChainWaterSystem:
                 "searchedLongitude": longitude,
                 "matchedLocation": f"{best_match['blockName']}, {best_match['district']}",
                 "confidenceScore": best_match.get('similarity_score', 0.8),
-                "dataSource": "ChromaDB RAG System"
+                "dataSource": data_source,
+                "promptStats": prompt_stats,
+                "aiGenerated": ai_generated
             }
             
         except Exception as e:
@@ -411,7 +454,12 @@ class LangChainWaterSystem:
             raise
     
     async def generate_langchain_insights(self, water_data: Dict[str, Any], language: str = "hi"):
-        """Generate AI-powered insights using LangChain RAG pipeline with ChromaDB"""
+        """Generate AI-powered insights using LangChain RAG pipeline.
+        
+        Returns (insights, prompt stats, ai_generated). Stats hold the token
+        estimates used for budgeting plus the LLM's reported token usage when
+        available; ai_generated is False when the canned fallback text is used.
+        """
         
         # Language configurations
         lang_config = {
@@ -436,39 +484,43 @@ class LangChainWaterSystem:
         }
         
         config = lang_config.get(language, lang_config["hi"])
+        prompt_stats = {}
         
         try:
-            # Prepare context from water data
-            context_text = f"""
-            Location: {water_data['blockName']}, {water_data['district']}, {water_data['state']}
-            Rainfall: {water_data['rainfall']} mm
-            Groundwater Recharge: {water_data['groundwaterRecharge']} ham
-            Natural Discharges: {water_data['naturalDischarges']} ham  
-            Annual Extractable: {water_data['annualExtractable']} ham
-            Groundwater Extraction: {water_data['groundwaterExtraction']} ham
-            Stage of Extraction: {water_data['stageOfExtraction']}%
-            Depth to Water: {water_data['depthToWater']} meters
-            Risk Level: {water_data['riskLevel']} ({config['risk_translations'][water_data['riskLevel']]})
-            """
-            
             # Create question for the RAG system
-            question = f"""
-            Analyze this water data and provide farmer-friendly insights in {config['name']}. 
-            Consider the risk level '{water_data['riskLevel']}' and provide practical water conservation advice.
-            """
+            question = QUESTION_TEMPLATE.format(
+                risk_level=water_data['riskLevel'],
+                risk_local=config['risk_translations'][water_data['riskLevel']]
+            )
             
-            # Use RetrievalQA chain with ChromaDB
-            result = await asyncio.get_event_loop().run_in_executor(
-                None,
-                lambda: self.qa_chain.invoke({
-                    "query": question,
-                    "language": language,
-                    "language_name": config['name']
-                })
+            # Retrieve nearby blocks and assemble a compact, token-budgeted context
+            query = f"{water_data['blockName']}, {water_data['district']}, {water_data['state']}"
+            docs = await run_in_executor(
+                lambda: self.vector_store.similarity_search(query, k=self.retrieval_k)
+            )
+            neighbours = [
+                self.records_by_id[doc.metadata["id"]]
+                for doc in docs if doc.metadata.get("id") in self.records_by_id
+            ]
+            prompt_inputs, prompt_stats = self.prompt_builder.build(water_data, neighbours, question, config['name'])
+            
+            result = await run_in_executor(
+                lambda: self.qa_chain.invoke(prompt_inputs)
+            )
+            
+            # Record the token counts Gemini actually billed, when reported
+            usage = getattr(result, "usage_metadata", None)
+            if usage:
+                for usage_key, stats_key in (("input_tokens", "promptTokens"), ("output_tokens", "outputTokens")):
+                    if usage.get(usage_key) is not None:
+                        prompt_stats[stats_key] = usage[usage_key]
+            logger.info(
+                f"📏 Prompt tokens: {prompt_stats.get('promptTokens', 'n/a')} "
+                f"(estimated {prompt_stats['estimatedPromptTokens']}, {prompt_stats['contextRecords']} blocks)"
             )
             
             # Parse the response
-            response_text = result["result"]
+            response_text = result.content if hasattr(result, "content") else str(result)
             
             # Extract JSON from response
             try:
@@ -477,26 +529,46 @@ class LangChainWaterSystem:
                 elif "```" in response_text:
                     response_text = response_text.split("```")[1].strip()
                 
-                insights = json.loads(response_text)
-                
-                # Validate required fields
-                required_fields = ["farmerMessage", "action", "explanation"]
-                if all(field in insights for field in required_fields):
-                    return insights
+                # Validate required fields, coercing lists/objects to text
+                insights = self._normalize_insights(json.loads(response_text))
+                if insights is not None:
+                    return insights, prompt_stats, True
                 else:
-                    raise ValueError("Missing required fields in LangChain response")
+                    raise ValueError("Missing or invalid required fields in LangChain response")
                     
             except json.JSONDecodeError as e:
                 logger.warning(f"⚠️ Failed to parse JSON from LangChain response: {e}")
                 # Try to extract structured data from text
-                return self._extract_insights_from_text(response_text, config)
+                insights = self._extract_insights_from_text(response_text)
+                if insights is not None:
+                    return insights, prompt_stats, True
+                return config["fallback"], prompt_stats, False
                 
         except Exception as e:
-            logger.warning(f"⚠️ LangChain RAG with ChromaDB failed, using fallback: {str(e)}")
-            return config["fallback"]
+            logger.warning(f"⚠️ LangChain RAG with {self.vector_store_backend} failed, using fallback: {str(e)}")
+            return config["fallback"], prompt_stats, False
+    
+    @staticmethod
+    def _normalize_insights(insights: Any) -> Optional[Dict[str, str]]:
+        """Coerce the insight fields to non-empty strings; None if that is not possible"""
+        if not isinstance(insights, dict):
+            return None
+        normalized = {}
+        for field in ("farmerMessage", "action", "explanation"):
+            value = insights.get(field)
+            if isinstance(value, dict):
+                value = list(value.values())
+            if isinstance(value, (list, tuple)):
+                value = " ".join(str(item).strip() for item in value if item is not None)
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                value = str(value)
+            if not isinstance(value, str) or not value.strip():
+                return None
+            normalized[field] = value.strip()
+        return normalized
     
-    def _extract_insights_from_text(self, text: str, config: Dict) -> Dict:
-        """Extract insights from unstructured text response"""
+    def _extract_insights_from_text(self, text: str) -> Optional[Dict]:
+        """Extract insights from unstructured text response; None if not possible"""
         try:
             lines = [line.strip() for line in text.split('\n') if line.strip()]
             farmer_message = ""
@@ -530,9 +602,9 @@ class LangChainWaterSystem:
             action = action.strip() if action else ""
             explanation = explanation.strip() if explanation else ""
             
-            # If we couldn't extract structured data, use fallback
+            # If we couldn't extract structured data, the caller uses the fallback
             if not all([farmer_message, action, explanation]):
-                return config["fallback"]
+                return None
             
             return {
                 "farmerMessage": farmer_message,
@@ -542,7 +614,7 @@ class LangChainWaterSystem:
             
         except Exception as e:
             logger.error(f"❌ Error extracting insights from text: {e}")
-            return config["fallback"]
+            return None
     
     async def search_similar_locations_by_coordinates(self, lat: float, lng: float, radius_km: float = 50):
         """Search for locations near given coordinates"""
@@ -589,13 +661,18 @@ class LangChainWaterSystem:
         return R * c
     
     def get_collection_stats(self):
-        """Get ChromaDB collection statistics"""
+        """Get vector store collection statistics"""
         try:
             if hasattr(self.vector_store, '_collection'):
-                collection = self.vector_store._collection
-                count = collection.count()
+                count = self.vector_store._collection.count()
+            elif hasattr(self.vector_store, 'count'):
+                count = self.vector_store.count()
+            else:
+                count = None
+            if count is not None:
                 return {
                     "total_documents": count,
+                    "backend": self.vector_store_backend,
                     "collection_name": self.collection_name,
                     "persist_directory": self.persist_directory
                 }
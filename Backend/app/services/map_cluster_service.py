@@ -0,0 +1,396 @@
+import json
+import math
+import hashlib
+import logging
+from typing import Dict, Any, List, Tuple, Iterable
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Web Mercator is undefined at the poles; Leaflet clamps to the same latitude
+MAX_LATITUDE = 85.05112878
+RISK_LEVELS = ("Green", "Yellow", "Red")
+
+# Aggregate columns kept per grid cell. Sums (rather than means) are stored so
+# that records can be added and removed without rebuilding the hierarchy.
+_COUNT, _SUM_X, _SUM_Y, _GREEN, _YELLOW, _RED, _SUM_DEPTH, _SUM_STAGE, _SUM_RAIN = range(9)
+_N_COLUMNS = 9
+
+# Per-block point columns and their dtypes
+_POINT_COLUMNS = {
+    "ids": np.int64,
+    "xs": np.float64,
+    "ys": np.float64,
+    "risks": np.int8,
+    "depths": np.float64,
+    "stages": np.float64,
+    "rains": np.float64,
+    "names": object,
+    "districts": object,
+    "alive": bool,
+}
+
+
+class MapTooLargeError(ValueError):
+    """Raised when a viewport would return more features than allowed"""
+
+
+class MapClusterService:
+    """Zoom-aware grid clustering of water blocks for the Leaflet map.
+
+    Blocks are held in numpy columns and projected to Web Mercator once. Each
+    zoom level stores one row of aggregates per occupied grid cell, keyed by a
+    sorted int64 cell id, so a viewport query is a pair of searchsorted calls.
+    Levels stop at the zoom where cells no longer merge blocks (more than
+    merge_ratio cells per block); past that the individual blocks in the
+    viewport are returned instead. upsert/remove touch only the affected
+    cells and keep the same levels a rebuild would.
+    """
+
+    def __init__(
+        self,
+        min_zoom: int = 0,
+        max_zoom: int = 14,
+        radius_px: int = 64,
+        tile_size: int = 256,
+        merge_ratio: float = 0.8,
+        max_features: int = 5000,
+    ):
+        self.min_zoom = min_zoom
+        self.max_zoom = max_zoom
+        self.radius_px = radius_px
+        self.tile_size = tile_size
+        self.merge_ratio = merge_ratio
+        self.max_features = max_features
+        # Digest of the loaded data, rolled forward by every update so ETags
+        # change with the data rather than with process lifetime
+        self.fingerprint = ""
+        self.cluster_max_zoom = min_zoom
+        # zoom -> (sorted cell keys, aggregate rows); holds the clustered levels
+        # plus the next, unused "probe" level so growth can be detected cheaply
+        self.grids: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+        self._reset_points()
+
+    def _reset_points(self, capacity: int = 0):
+        # Columns live in over-allocated buffers; the public attributes are views
+        # of the first _size rows so appends are amortized O(batch)
+        self._buffers = {name: np.empty(capacity, dtype=dtype) for name, dtype in _POINT_COLUMNS.items()}
+        self._size = 0
+        self._live = 0
+        self._sync_views()
+
+    def _sync_views(self):
+        for name, buffer in self._buffers.items():
+            setattr(self, name, buffer[:self._size])
+
+    def _columns(self, records: List[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+        """Convert records to point columns"""
+        xs, ys = self._project(
+            np.array([r["longitude"] for r in records], dtype=np.float64),
+            np.array([r["latitude"] for r in records], dtype=np.float64),
+        )
+        risk_codes = {level: code for code, level in enumerate(RISK_LEVELS)}
+        return {
+            "ids": np.array([r["id"] for r in records], dtype=np.int64),
+            "xs": xs,
+            "ys": ys,
+            "risks": np.array([risk_codes.get(r["riskLevel"], -1) for r in records], dtype=np.int8),
+            "depths": np.array([r["depthToWater"] for r in records], dtype=np.float64),
+            "stages": np.array([r["stageOfExtraction"] for r in records], dtype=np.float64),
+            "rains": np.array([r["rainfall"] for r in records], dtype=np.float64),
+            "names": np.array([r["blockName"] for r in records], dtype=object),
+            "districts": np.array([r["district"] for r in records], dtype=object),
+            "alive": np.ones(len(records), dtype=bool),
+        }
+
+    def _write(self, rows: np.ndarray, columns: Dict[str, np.ndarray]):
+        for name, values in columns.items():
+            getattr(self, name)[rows] = values
+
+    def _append(self, columns: Dict[str, np.ndarray]) -> np.ndarray:
+        """Append columns as new rows; returns their row indices"""
+        start, count = self._size, len(columns["ids"])
+        capacity = len(self._buffers["ids"])
+        if start + count > capacity:
+            capacity = max(start + count, 2 * capacity)
+            for name, buffer in self._buffers.items():
+                grown = np.empty(capacity, dtype=buffer.dtype)
+                grown[:start] = buffer[:start]
+                self._buffers[name] = grown
+        self._size += count
+        self._live += count
+        self._sync_views()
+        rows = np.arange(start, self._size)
+        self._write(rows, columns)
+        return rows
+
+    def _compact(self):
+        """Drop rows of removed blocks once they make up half of the arrays"""
+        if self._live * 2 >= self._size:
+            return
+        keep = self.alive
+        self._buffers = {name: getattr(self, name)[keep] for name in _POINT_COLUMNS}
+        self._size = self._live
+        self._sync_views()
+
+    def _roll_fingerprint(self, tag: bytes, columns: Dict[str, np.ndarray]):
+        digest = hashlib.blake2b(self.fingerprint.encode() + tag, digest_size=8)
+        for name, values in columns.items():
+            if values.dtype == object:
+                digest.update("\x1f".join(map(str, values.tolist())).encode("utf-8"))
+            else:
+                digest.update(np.ascontiguousarray(values).tobytes())
+        self.fingerprint = digest.hexdigest()
+
+    def build(self, records: Iterable[Dict[str, Any]]):
+        """Build the cluster hierarchy from scratch"""
+        records = list(records)
+        self._reset_points(len(records))
+        columns = self._columns(records) if records else {}
+        if records:
+            self._append(columns)
+        self.fingerprint = ""
+        self._roll_fingerprint(b"build", columns)
+
+        rows = np.arange(self._size)
+        self.grids = {self.min_zoom: self._aggregate(rows, self.min_zoom)}
+        if self.min_zoom < self.max_zoom:
+            self.grids[self.min_zoom + 1] = self._aggregate(rows, self.min_zoom + 1)
+        self.cluster_max_zoom = self.min_zoom
+        self._update_levels()
+
+        logger.info(f"✅ Built map clusters for {self._live} blocks across zoom {self.min_zoom}-{self.cluster_max_zoom}")
+
+    def upsert(self, records: Iterable[Dict[str, Any]]):
+        """Add or replace blocks without rebuilding the hierarchy"""
+        # The last record wins when an id repeats within the batch
+        records = list({r["id"]: r for r in records}.values())
+        if not records:
+            return
+        columns = self._columns(records)
+        self._roll_fingerprint(b"upsert", columns)
+
+        existing = self._rows_for_ids(columns["ids"])
+        replaced = existing >= 0
+        # Replaced blocks are updated in place: subtract, overwrite, add back
+        rows = existing[replaced]
+        self._apply_rows(rows, -1.0)
+        self._write(rows, {name: values[replaced] for name, values in columns.items()})
+        if not replaced.all():
+            rows = np.concatenate([rows, self._append({name: values[~replaced] for name, values in columns.items()})])
+        self._apply_rows(rows, 1.0)
+        self._update_levels()
+
+    def remove(self, ids: Iterable[int]):
+        """Remove blocks without rebuilding the hierarchy"""
+        ids = np.unique(np.array(list(ids), dtype=np.int64))
+        rows = self._rows_for_ids(ids)
+        rows = rows[rows >= 0]
+        if not len(rows):
+            return
+        self._roll_fingerprint(b"remove", {"ids": ids})
+        self._apply_rows(rows, -1.0)
+        self.alive[rows] = False
+        self._live -= len(rows)
+        self._compact()
+        self._update_levels()
+
+    def _rows_for_ids(self, ids: np.ndarray) -> np.ndarray:
+        """Row of each live block id, or -1 if the id is not present"""
+        rows = np.flatnonzero(self.alive & np.isin(self.ids, ids))
+        if not len(rows):
+            return np.full(len(ids), -1, dtype=np.int64)
+        order = np.argsort(self.ids[rows])
+        found_ids, rows = self.ids[rows][order], rows[order]
+        pos = np.minimum(np.searchsorted(found_ids, ids), len(found_ids) - 1)
+        return np.where(found_ids[pos] == ids, rows[pos], -1)
+
+    def _update_levels(self):
+        """Keep exactly the clustered levels a rebuild would keep for the current data.
+
+        Cells nest across zooms, so cell counts only grow with zoom and the kept
+        levels are a prefix: drop levels that stopped merging blocks, or promote
+        the probe level (aggregating a new probe) while it merges them.
+        """
+        limit = self.merge_ratio * self._live
+        for zoom in range(self.min_zoom + 1, self.cluster_max_zoom + 1):
+            if len(self.grids[zoom][0]) > limit:
+                for dropped in range(zoom + 1, self.max_zoom + 1):
+                    self.grids.pop(dropped, None)
+                self.cluster_max_zoom = zoom - 1
+                return
+
+        while self.cluster_max_zoom < self.max_zoom and len(self.grids[self.cluster_max_zoom + 1][0]) <= limit:
+            self.cluster_max_zoom += 1
+            probe = self.cluster_max_zoom + 1
+            if probe <= self.max_zoom:
+                self.grids[probe] = self._aggregate(np.flatnonzero(self.alive), probe)
+
+    def _cells_per_axis(self, zoom: int) -> int:
+        return (1 << zoom) * self.tile_size // self.radius_px
+
+    @staticmethod
+    def _project(lng, lat):
+        """Project to normalized Web Mercator coordinates in [0, 1]"""
+        lat = np.clip(lat, -MAX_LATITUDE, MAX_LATITUDE)
+        x = (np.asarray(lng, dtype=np.float64) + 180.0) / 360.0
+        sin_lat = np.sin(np.radians(lat))
+        y = 0.5 - np.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)
+        return np.clip(x, 0.0, 1.0), np.clip(y, 0.0, 1.0)
+
+    @staticmethod
+    def _unproject(x, y):
+        lng = np.asarray(x) * 360.0 - 180.0
+        lat = np.degrees(np.arctan(np.sinh(math.pi * (1 - 2 * np.asarray(y)))))
+        return lng, lat
+
+    def _cells(self, xs, ys, zoom: int):
+        n = self._cells_per_axis(zoom)
+        cx = np.minimum((np.asarray(xs) * n).astype(np.int64), n - 1)
+        cy = np.minimum((np.asarray(ys) * n).astype(np.int64), n - 1)
+        return cx, cy
+
+    def _aggregate(self, rows: np.ndarray, zoom: int, sign: float = 1.0):
+        """Per-cell aggregates of the given rows at zoom, as (sorted keys, values)"""
+        n = self._cells_per_axis(zoom)
+        cx, cy = self._cells(self.xs[rows], self.ys[rows], zoom)
+        keys, inverse = np.unique(cx * n + cy, return_inverse=True)
+        m = len(keys)
+        values = np.zeros((m, _N_COLUMNS), dtype=np.float64)
+        values[:, _COUNT] = np.bincount(inverse, minlength=m)
+        values[:, _SUM_X] = np.bincount(inverse, weights=self.xs[rows], minlength=m)
+        values[:, _SUM_Y] = np.bincount(inverse, weights=self.ys[rows], minlength=m)
+        risks = self.risks[rows]
+        for code, column in enumerate((_GREEN, _YELLOW, _RED)):
+            values[:, column] = np.bincount(inverse, weights=(risks == code).astype(np.float64), minlength=m)
+        values[:, _SUM_DEPTH] = np.bincount(inverse, weights=self.depths[rows], minlength=m)
+        values[:, _SUM_STAGE] = np.bincount(inverse, weights=self.stages[rows], minlength=m)
+        values[:, _SUM_RAIN] = np.bincount(inverse, weights=self.rains[rows], minlength=m)
+        return keys, values * sign
+
+    def _apply_rows(self, rows: np.ndarray, sign: float):
+        """Add (sign=1) or subtract (sign=-1) rows from every stored zoom level.
+
+        Only the touched cells change: existing cells are updated in place,
+        emptied cells are deleted and new cells inserted at their sorted position.
+        """
+        if not len(rows):
+            return
+        for zoom, (grid_keys, grid_values) in self.grids.items():
+            keys, values = self._aggregate(rows, zoom, sign)
+            pos = np.searchsorted(grid_keys, keys)
+            found = pos < len(grid_keys)
+            found[found] = grid_keys[pos[found]] == keys[found]
+            grid_values[pos[found]] += values[found]
+
+            emptied = pos[found][grid_values[pos[found], _COUNT] < 0.5]
+            if len(emptied):
+                grid_keys = np.delete(grid_keys, emptied)
+                grid_values = np.delete(grid_values, emptied, axis=0)
+            if not found.all():
+                new_keys = keys[~found]
+                at = np.searchsorted(grid_keys, new_keys)
+                grid_keys = np.insert(grid_keys, at, new_keys)
+                grid_values = np.insert(grid_values, at, values[~found], axis=0)
+            self.grids[zoom] = (grid_keys, grid_values)
+
+    @staticmethod
+    def _precision(zoom: int) -> int:
+        """Decimal places needed to keep coordinates accurate to about one pixel"""
+        return max(0, math.ceil(math.log10(256 * (1 << zoom) / 360.0)))
+
+    def _bounds(self, bbox: Tuple[float, float, float, float]) -> Tuple[float, float, float, float]:
+        west, south, east, north = bbox
+        x0, y0 = self._project(west, north)
+        x1, y1 = self._project(east, south)
+        return float(x0), float(y0), float(x1), float(y1)
+
+    def _cell_range(self, bbox: Tuple[float, float, float, float], zoom: int) -> Tuple[int, int, int, int]:
+        x0, y0, x1, y1 = self._bounds(bbox)
+        cx0, cy0 = self._cells(x0, y0, zoom)
+        cx1, cy1 = self._cells(x1, y1, zoom)
+        return int(cx0), int(cy0), int(cx1), int(cy1)
+
+    def etag(self, bbox: Tuple[float, float, float, float], zoom: int) -> str:
+        """ETag for a viewport, derived from the data fingerprint and covered cells"""
+        zoom = max(self.min_zoom, zoom)
+        cx0, cy0, cx1, cy1 = self._cell_range(bbox, min(zoom, self.max_zoom))
+        return f'W/"{self.fingerprint}-{zoom}-{cx0}-{cy0}-{cx1}-{cy1}"'
+
+    def _clusters_in_range(self, zoom: int, cell_range: Tuple[int, int, int, int]) -> np.ndarray:
+        keys, values = self.grids[zoom]
+        n = self._cells_per_axis(zoom)
+        cx0, cy0, cx1, cy1 = cell_range
+        # Keys are cx * n + cy, so one column range of cells is a contiguous slice
+        lo = np.searchsorted(keys, cx0 * n)
+        hi = np.searchsorted(keys, (cx1 + 1) * n)
+        cy = keys[lo:hi] % n
+        return values[lo:hi][(cy >= cy0) & (cy <= cy1)]
+
+    def _check_size(self, count: int):
+        if count > self.max_features:
+            raise MapTooLargeError(
+                f"Viewport contains {count} features, more than {self.max_features}; zoom in or shrink the bbox"
+            )
+
+    def get_clusters(self, bbox: Tuple[float, float, float, float], zoom: int) -> Dict[str, Any]:
+        """Return a GeoJSON FeatureCollection of clusters visible in bbox at zoom.
+
+        Raises MapTooLargeError if more than max_features would be returned.
+        """
+        zoom = max(self.min_zoom, zoom)
+        digits = self._precision(zoom)
+        features = []
+
+        if zoom > self.cluster_max_zoom:
+            # Past the last clustered level the individual blocks are returned
+            x0, y0, x1, y1 = self._bounds(bbox)
+            rows = np.flatnonzero(self.alive & (self.xs >= x0) & (self.xs <= x1) & (self.ys >= y0) & (self.ys <= y1))
+            self._check_size(len(rows))
+            lngs, lats = self._unproject(self.xs[rows], self.ys[rows])
+            for row, lng, lat in zip(rows.tolist(), lngs.tolist(), lats.tolist()):
+                risk = int(self.risks[row])
+                features.append({
+                    "type": "Feature",
+                    "id": int(self.ids[row]),
+                    "geometry": {"type": "Point", "coordinates": [round(lng, digits), round(lat, digits)]},
+                    "properties": {
+                        "cluster": False,
+                        "blockName": self.names[row],
+                        "district": self.districts[row],
+                        "riskLevel": RISK_LEVELS[risk] if risk >= 0 else None,
+                        "depthToWater": float(self.depths[row]),
+                        "stageOfExtraction": float(self.stages[row]),
+                        "rainfall": float(self.rains[row]),
+                    },
+                })
+        else:
+            clusters = self._clusters_in_range(zoom, self._cell_range(bbox, zoom))
+            self._check_size(len(clusters))
+            counts = clusters[:, _COUNT]
+            lngs, lats = self._unproject(clusters[:, _SUM_X] / counts, clusters[:, _SUM_Y] / counts)
+            for agg, lng, lat in zip(clusters.tolist(), lngs.tolist(), lats.tolist()):
+                count = agg[_COUNT]
+                features.append({
+                    "type": "Feature",
+                    "geometry": {"type": "Point", "coordinates": [round(lng, digits), round(lat, digits)]},
+                    "properties": {
+                        "cluster": True,
+                        "pointCount": int(round(count)),
+                        "riskCounts": {
+                            "Green": int(round(agg[_GREEN])),
+                            "Yellow": int(round(agg[_YELLOW])),
+                            "Red": int(round(agg[_RED])),
+                        },
+                        "avgDepthToWater": round(agg[_SUM_DEPTH] / count, 2),
+                        "avgStageOfExtraction": round(agg[_SUM_STAGE] / count, 2),
+                        "avgRainfall": round(agg[_SUM_RAIN] / count, 2),
+                    },
+                })
+
+        return {"type": "FeatureCollection", "features": features}
+
+    def render(self, bbox: Tuple[float, float, float, float], zoom: int) -> bytes:
+        """Compact JSON encoding of get_clusters"""
+        return json.dumps(self.get_clusters(bbox, zoom), separators=(",", ":"), ensure_ascii=False).encode("utf-8")
@@ -0,0 +1,254 @@
+import sys
+import hmac
+import json
+import time
+import uuid
+import asyncio
+import threading
+import logging
+from collections import Counter
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Leaf functions of threads that are parked rather than doing work
+IDLE_FRAMES = {"wait", "select", "poll", "_wait_for_tstate_lock"}
+
+Frame = Tuple[str, str, int]
+
+
+class StackSampler:
+    """Samples the Python stacks of a request's threads at a fixed interval.
+
+    Only the event-loop thread that started the sampler and executor threads
+    currently running work submitted through run_in_executor for this request
+    are sampled. Other requests interleaved on the event loop still show up
+    under the event-loop thread; ProfilingService keeps that noise bounded by
+    allowing only one active profile at a time.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self.started_at = 0.0
+        self.duration = 0.0
+        self.thread_ids = set()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def add_thread(self, thread_id: int):
+        self.thread_ids.add(thread_id)
+
+    def remove_thread(self, thread_id: int):
+        self.thread_ids.discard(thread_id)
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        self.thread_ids = {threading.get_ident()}
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.duration = time.perf_counter() - self.started_at
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            thread_ids = set(self.thread_ids)
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id not in thread_ids or frame.f_code.co_name in IDLE_FRAMES:
+                    continue
+                stack: List[Frame] = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+                    frame = frame.f_back
+                stack.append((f"thread:{names.get(thread_id, thread_id)}", "", 0))
+                self.samples[tuple(reversed(stack))] += 1
+
+    def to_collapsed(self) -> str:
+        """Brendan Gregg's collapsed-stack format, one "a;b;c count" per line"""
+        lines = []
+        for stack, count in self.samples.most_common():
+            frames = ";".join(name if not filename else f"{name} ({filename}:{line})" for name, filename, line in stack)
+            lines.append(f"{frames} {count}")
+        return "\n".join(lines) + "\n"
+
+    def to_speedscope(self, name: str) -> Dict[str, Any]:
+        """speedscope.app sampled-profile JSON"""
+        frame_index: Dict[Frame, int] = {}
+        frames = []
+        samples = []
+        weights = []
+        for stack, count in self.samples.items():
+            indices = []
+            for frame in stack:
+                if frame not in frame_index:
+                    frame_index[frame] = len(frames)
+                    frame_name, filename, line = frame
+                    frames.append({"name": frame_name, "file": filename, "line": line} if filename else {"name": frame_name})
+                indices.append(frame_index[frame])
+            samples.append(indices)
+            weights.append(count * self.interval)
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "water-level-api",
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": name,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": samples,
+                "weights": weights,
+            }],
+        }
+
+
+# Sampler of the request being profiled, visible to the tasks it spawns
+_current_sampler: ContextVar[Optional[StackSampler]] = ContextVar("current_sampler", default=None)
+
+
+async def run_in_executor(func, *args):
+    """loop.run_in_executor on the default executor that attributes the worker
+    thread to the active request profile, if any"""
+    loop = asyncio.get_running_loop()
+    sampler = _current_sampler.get()
+    if sampler is None:
+        return await loop.run_in_executor(None, func, *args)
+
+    def tracked():
+        thread_id = threading.get_ident()
+        sampler.add_thread(thread_id)
+        try:
+            return func(*args)
+        finally:
+            sampler.remove_thread(thread_id)
+
+    return await loop.run_in_executor(None, tracked)
+
+
+class ProfilingService:
+    """Opt-in per-request profiling with bounded on-disk retention.
+
+    A request is profiled when it carries the trigger header together with a
+    valid admin token or, if sample_every is N > 0, for every Nth request.
+    Only one request is profiled at a time; others that would be profiled
+    while a profile is running are served unprofiled. Each profile is stored
+    as collapsed stacks plus speedscope JSON; only the newest max_profiles are
+    kept. Enabling profiling requires an admin token.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        profile_dir: str = "profiles",
+        sample_every: int = 0,
+        max_profiles: int = 50,
+        interval: float = 0.005,
+        trigger_header: str = "x-profile",
+        admin_token: Optional[str] = None,
+        admin_header: str = "x-admin-token",
+    ):
+        if enabled and not admin_token:
+            raise ValueError("ADMIN_TOKEN must be set when profiling is enabled")
+        self.enabled = enabled
+        self.admin_token = admin_token
+        self.admin_header = admin_header
+        self.profile_dir = Path(profile_dir)
+        self.sample_every = sample_every
+        self.max_profiles = max_profiles
+        self.interval = interval
+        self.trigger_header = trigger_header
+        self._request_count = 0
+        self._active: Optional[StackSampler] = None
+        self._lock = threading.Lock()
+        if enabled:
+            self.profile_dir.mkdir(parents=True, exist_ok=True)
+
+    def is_authorized(self, headers) -> bool:
+        token = headers.get(self.admin_header, "")
+        return bool(self.admin_token) and hmac.compare_digest(token.encode("utf-8"), self.admin_token.encode("utf-8"))
+
+    def should_profile(self, headers) -> bool:
+        if headers.get(self.trigger_header, "").lower() in ("1", "true", "yes") and self.is_authorized(headers):
+            return True
+        if self.sample_every > 0:
+            with self._lock:
+                self._request_count += 1
+                return self._request_count % self.sample_every == 0
+        return False
+
+    def start(self) -> Optional[StackSampler]:
+        """Start profiling the current request; None if another profile is running"""
+        with self._lock:
+            if self._active is not None:
+                return None
+            self._active = sampler = StackSampler(self.interval)
+        sampler.start()
+        _current_sampler.set(sampler)
+        return sampler
+
+    def stop(self, sampler: StackSampler):
+        sampler.stop()
+        _current_sampler.set(None)
+        with self._lock:
+            self._active = None
+
+    async def stop_async(self, sampler: StackSampler):
+        """stop() with the sampler thread join run off the event loop"""
+        _current_sampler.set(None)
+        await run_in_executor(self.stop, sampler)
+
+    async def save_async(self, sampler: StackSampler, method: str, path: str, status_code: int) -> str:
+        """save() with the file writes run off the event loop"""
+        return await run_in_executor(self.save, sampler, method, path, status_code)
+
+    def save(self, sampler: StackSampler, method: str, path: str, status_code: int) -> str:
+        """Write the profile files and enforce retention; returns the profile id"""
+        profile_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        name = f"{method} {path}"
+        (self.profile_dir / f"{profile_id}.collapsed.txt").write_text(sampler.to_collapsed(), encoding="utf-8")
+        with open(self.profile_dir / f"{profile_id}.speedscope.json", "w", encoding="utf-8") as f:
+            json.dump(sampler.to_speedscope(name), f)
+        with open(self.profile_dir / f"{profile_id}.meta.json", "w", encoding="utf-8") as f:
+            json.dump({
+                "id": profile_id,
+                "request": name,
+                "statusCode": status_code,
+                "durationMs": round(sampler.duration * 1000, 2),
+                "samples": sum(sampler.samples.values()),
+                "createdAt": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            }, f)
+        self._enforce_retention()
+        logger.info(f"📈 Saved profile {profile_id} for {name} ({sampler.duration * 1000:.0f} ms)")
+        return profile_id
+
+    def _enforce_retention(self):
+        metas = sorted(self.profile_dir.glob("*.meta.json"))
+        for meta in metas[:max(len(metas) - self.max_profiles, 0)]:
+            profile_id = meta.name[:-len(".meta.json")]
+            for path in self.profile_dir.glob(f"{profile_id}.*"):
+                path.unlink(missing_ok=True)
+
+    def list_profiles(self) -> List[Dict[str, Any]]:
+        profiles = []
+        for meta in sorted(self.profile_dir.glob("*.meta.json"), reverse=True):
+            with open(meta, "r", encoding="utf-8") as f:
+                profiles.append(json.load(f))
+        return profiles
+
+    def profile_path(self, profile_id: str, fmt: str) -> Optional[Path]:
+        suffix = {"speedscope": "speedscope.json", "collapsed": "collapsed.txt"}.get(fmt)
+        # Profile ids are generated here; reject anything that could escape the directory
+        if suffix is None or not profile_id.replace("-", "").isalnum():
+            return None
+        path = self.profile_dir / f"{profile_id}.{suffix}"
+        return path if path.exists() else None
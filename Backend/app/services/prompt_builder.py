@@ -0,0 +1,116 @@
+import math
+import logging
+from typing import Dict, Any, List, Callable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (record key, compact column label) rendered for every block in the context table
+CONTEXT_FIELDS = [
+    ("blockName", "block"),
+    ("district", "district"),
+    ("state", "state"),
+    ("rainfall", "rain_mm"),
+    ("groundwaterRecharge", "recharge_ham"),
+    ("annualExtractable", "extractable_ham"),
+    ("groundwaterExtraction", "extraction_ham"),
+    ("stageOfExtraction", "stage_pct"),
+    ("depthToWater", "depth_m"),
+    ("riskLevel", "risk"),
+]
+
+QA_TEMPLATE = """You are an agricultural water expert advising Indian farmers.
+Blocks (first row is the farmer's block, others are nearby for comparison):
+{context}
+
+Task: {question}
+Reply in simple {language_name} only, practical and empathetic, as JSON:
+{{"farmerMessage": "2-3 lines on the current water situation and risk", "action": "1-2 lines of specific irrigation/conservation advice", "explanation": "2-3 lines explaining the trend simply"}}"""
+
+# Task sent with every request; risk_local is the risk level in the reply language
+QUESTION_TEMPLATE = (
+    "Give farmer-friendly insights for the first block (risk level "
+    "'{risk_level}', {risk_local}) with practical water conservation advice."
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token) that needs no tokenizer"""
+    return math.ceil(len(text) / 4)
+
+
+class PromptBuilder:
+    """Assembles the QA prompt under a fixed token budget.
+
+    Retrieved records are rendered as rows of one compact field table instead
+    of verbose documents. The target block is always included; neighbours are
+    added in retrieval order, skipping duplicates, until the budget is used up.
+    """
+
+    def __init__(
+        self,
+        token_budget: int = 600,
+        max_neighbours: int = 3,
+        count_tokens: Optional[Callable[[str], int]] = None,
+    ):
+        self.token_budget = token_budget
+        self.max_neighbours = max_neighbours
+        self.count_tokens = count_tokens or estimate_tokens
+        self.header = "|".join(label for _, label in CONTEXT_FIELDS)
+
+    @staticmethod
+    def _format_value(value: Any) -> str:
+        if isinstance(value, float):
+            return f"{value:g}"
+        return str(value).replace(" District", "").replace("|", "/")
+
+    def render_row(self, record: Dict[str, Any]) -> str:
+        return "|".join(self._format_value(record.get(key, "")) for key, _ in CONTEXT_FIELDS)
+
+    def build_context(
+        self, target: Dict[str, Any], neighbours: List[Dict[str, Any]], budget: int
+    ) -> Tuple[str, int]:
+        """Render target plus as many ranked, deduplicated neighbours as fit in budget"""
+        lines = [self.header, self.render_row(target)]
+        used = self.count_tokens("\n".join(lines))
+        seen = {target.get("id")}
+        included = 0
+
+        for record in neighbours:
+            if included >= self.max_neighbours:
+                break
+            if record.get("id") in seen:
+                continue
+            row = self.render_row(record)
+            row_tokens = self.count_tokens("\n" + row)
+            if used + row_tokens > budget:
+                break
+            lines.append(row)
+            used += row_tokens
+            seen.add(record.get("id"))
+            included += 1
+
+        return "\n".join(lines), included
+
+    def build(
+        self,
+        target: Dict[str, Any],
+        neighbours: List[Dict[str, Any]],
+        question: str,
+        language_name: str,
+    ) -> Tuple[Dict[str, str], Dict[str, int]]:
+        """Return the prompt inputs and estimated token stats for one request"""
+        fixed = QA_TEMPLATE.format(context="", question=question, language_name=language_name)
+        fixed_tokens = self.count_tokens(fixed)
+        context, included = self.build_context(target, neighbours, max(self.token_budget - fixed_tokens, 0))
+
+        inputs = {"context": context, "question": question, "language_name": language_name}
+        # Estimates drive the budget; real counts come from the LLM's usage metadata
+        stats = {
+            "estimatedPromptTokens": self.count_tokens(QA_TEMPLATE.format(**inputs)),
+            "estimatedContextTokens": self.count_tokens(context),
+            "contextRecords": included + 1,
+            "tokenBudget": self.token_budget,
+        }
+        if stats["estimatedPromptTokens"] > self.token_budget:
+            logger.warning(f"⚠️ Prompt exceeds token budget even with target block only: {stats}")
+        return inputs, stats
@@ -0,0 +1,271 @@
+import json
+import hashlib
+import logging
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Iterable, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+logger = logging.getLogger(__name__)
+
+# Metadata keys that can be used as pre-filters, e.g. filter={"state": "Punjab"}
+FILTER_KEYS = ("state", "district", "risk_level")
+
+
+class NumpyVectorStore(VectorStore):
+    """Exact in-process vector store backed by a memory-mapped .npy file.
+
+    Embeddings are L2-normalized and stored as float32, or as int8 with a
+    per-row scale when quantize=True. A search is a single matrix-vector
+    product followed by argpartition, with metadata filters applied as
+    boolean masks before ranking.
+    """
+
+    def __init__(
+        self,
+        embedding: Embeddings,
+        persist_directory: str,
+        collection_name: str,
+        quantize: bool = False,
+    ):
+        self.embedding = embedding
+        self.persist_directory = Path(persist_directory)
+        self.collection_name = collection_name
+        self.quantize = quantize
+        self.vectors: Optional[np.ndarray] = None
+        self.scales: Optional[np.ndarray] = None
+        self.texts: List[str] = []
+        self.metadatas: List[Dict[str, Any]] = []
+        self.filter_columns: Dict[str, np.ndarray] = {}
+        self.fingerprint: Optional[str] = None
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding
+
+    def _paths(self) -> Tuple[Path, Path, Path]:
+        base = self.persist_directory / self.collection_name
+        return (
+            base.with_suffix(".npy"),
+            base.with_name(f"{self.collection_name}_scales.npy"),
+            base.with_suffix(".json"),
+        )
+
+    @staticmethod
+    def _embedding_identity(embedding: Embeddings) -> str:
+        """Class and model name of an embedding, e.g. HuggingFaceEmbeddings:all-MiniLM-L6-v2"""
+        model = next(
+            (getattr(embedding, attr) for attr in ("model_name", "model", "model_id") if getattr(embedding, attr, None)),
+            "",
+        )
+        return f"{type(embedding).__name__}:{model}"
+
+    @staticmethod
+    def _fingerprint(
+        texts: List[str], metadatas: List[Dict[str, Any]], quantize: bool, model: str = "", dimension: int = 0
+    ) -> str:
+        digest = hashlib.sha256()
+        digest.update(b"int8" if quantize else b"float32")
+        # A different model or vector width makes every stored vector unusable
+        digest.update(f"{model}|{dimension}".encode("utf-8"))
+        for text, metadata in zip(texts, metadatas):
+            digest.update(text.encode("utf-8"))
+            digest.update(json.dumps(metadata, sort_keys=True, default=str).encode("utf-8"))
+        return digest.hexdigest()
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+        persist_directory: str = "vector_db",
+        collection_name: str = "water_level_data",
+        quantize: bool = False,
+        **kwargs: Any,
+    ) -> "NumpyVectorStore":
+        """Load the persisted index if it matches texts, otherwise embed and persist"""
+        store = cls(embedding, persist_directory, collection_name, quantize=quantize)
+        metadatas = metadatas or [{} for _ in texts]
+        dimension = len(embedding.embed_query(texts[0])) if texts else 0
+        fingerprint = cls._fingerprint(texts, metadatas, quantize, cls._embedding_identity(embedding), dimension)
+
+        if store.load() and store.fingerprint == fingerprint:
+            logger.info(f"✅ Loaded {len(store.texts)} vectors from {persist_directory}")
+            return store
+
+        # A stale index must not leak rows into the rebuild, so start from a clean store
+        store = cls(embedding, persist_directory, collection_name, quantize=quantize)
+        store.add_texts(texts, metadatas)
+        store.fingerprint = fingerprint
+        store.persist()
+        return store
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        vectors = np.asarray(self.embedding.embed_documents(texts), dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors /= np.maximum(norms, 1e-12)
+
+        if self.quantize:
+            scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127.0
+            vectors = np.round(vectors / scales[:, None]).astype(np.int8)
+            self.scales = scales.astype(np.float32) if self.scales is None else np.concatenate([self.scales, scales])
+
+        start = len(self.texts)
+        self.vectors = vectors if self.vectors is None else np.concatenate([self.vectors, vectors])
+        self.texts.extend(texts)
+        self.metadatas.extend(metadatas)
+        self._build_filter_columns()
+        return [str(i) for i in range(start, len(self.texts))]
+
+    def _build_filter_columns(self):
+        self.filter_columns = {
+            key: np.array([str(m.get(key, "")) for m in self.metadatas], dtype=object)
+            for key in FILTER_KEYS
+        }
+
+    def persist(self):
+        """Write vectors to .npy and texts/metadata to a JSON sidecar"""
+        self.persist_directory.mkdir(parents=True, exist_ok=True)
+        vectors_path, scales_path, meta_path = self._paths()
+        np.save(vectors_path, self.vectors)
+        if self.quantize:
+            np.save(scales_path, self.scales)
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "fingerprint": self.fingerprint,
+                "quantize": self.quantize,
+                "texts": self.texts,
+                "metadatas": self.metadatas,
+            }, f, ensure_ascii=False)
+
+    def load(self) -> bool:
+        """Memory-map a persisted index; returns False if none exists or it is unreadable"""
+        vectors_path, scales_path, meta_path = self._paths()
+        if not vectors_path.exists() or not meta_path.exists():
+            return False
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("quantize") != self.quantize:
+                return False
+            vectors = np.load(vectors_path, mmap_mode="r")
+            scales = np.load(scales_path) if self.quantize else None
+            texts, metadatas = meta["texts"], meta["metadatas"]
+            if vectors.ndim != 2 or len(vectors) != len(texts) or len(metadatas) != len(texts):
+                raise ValueError("vector and text counts differ")
+            if scales is not None and len(scales) != len(texts):
+                raise ValueError("scale and text counts differ")
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            # A partial write or a missing sidecar is treated as no index, so it gets rebuilt
+            logger.warning(f"⚠️ Ignoring unreadable vector index in {self.persist_directory}: {e}")
+            return False
+
+        self.vectors = vectors
+        self.scales = scales
+        self.texts = texts
+        self.metadatas = metadatas
+        self.fingerprint = meta.get("fingerprint")
+        self._build_filter_columns()
+        return True
+
+    def _filter_mask(self, filter: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        if not filter:
+            return None
+        mask = np.ones(len(self.texts), dtype=bool)
+        for key, value in filter.items():
+            column = self.filter_columns.get(key)
+            if column is None:
+                column = np.array([str(m.get(key, "")) for m in self.metadatas], dtype=object)
+            values = value if isinstance(value, (list, tuple, set)) else [value]
+            mask &= np.isin(column, [str(v) for v in values])
+        return mask
+
+    def _search_vector(self, query_vector: np.ndarray, k: int, filter: Optional[Dict[str, Any]] = None):
+        if self.vectors is None or not len(self.texts):
+            return []
+        query = np.array(query_vector, dtype=np.float32)
+        query /= max(float(np.linalg.norm(query)), 1e-12)
+
+        scores = self.vectors @ query
+        if self.quantize:
+            scores = scores * self.scales
+
+        mask = self._filter_mask(filter)
+        if mask is not None:
+            scores = np.where(mask, scores, -np.inf)
+            k = min(k, int(mask.sum()))
+        k = min(k, len(scores))
+        if k <= 0:
+            return []
+
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            (Document(page_content=self.texts[i], metadata=self.metadatas[i]), float(scores[i]))
+            for i in top
+        ]
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        return self._search_vector(self.embedding.embed_query(query), k, filter)
+
+    def _similarity_search_with_relevance_scores(
+        self, query: str, k: int = 4, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        # Cosine similarity in [-1, 1] mapped to a [0, 1] relevance score
+        return [(doc, (score + 1) / 2) for doc, score in self.similarity_search_with_score(query, k, **kwargs)]
+
+    def similarity_search(
+        self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs: Any
+    ) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter)]
+
+    def similarity_search_by_vector(
+        self, embedding: List[float], k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs: Any
+    ) -> List[Document]:
+        return [doc for doc, _ in self._search_vector(np.asarray(embedding), k, filter)]
+
+    def count(self) -> int:
+        return len(self.texts)
+
+
+def create_vector_store(
+    backend: str,
+    documents: List[Document],
+    embedding: Embeddings,
+    persist_directory: str,
+    collection_name: str,
+    quantize: bool = False,
+) -> VectorStore:
+    """Build the configured vector store backend ("numpy" or "chroma")"""
+    if backend == "chroma":
+        # Imported lazily so the numpy backend does not pay for chromadb
+        from langchain_chroma import Chroma
+
+        return Chroma.from_documents(
+            documents=documents,
+            embedding=embedding,
+            persist_directory=persist_directory,
+            collection_name=collection_name
+        )
+    if backend == "numpy":
+        return NumpyVectorStore.from_documents(
+            documents=documents,
+            embedding=embedding,
+            persist_directory=persist_directory,
+            collection_name=collection_name,
+            quantize=quantize
+        )
+    raise ValueError(f"Unknown vector store backend: {backend}")
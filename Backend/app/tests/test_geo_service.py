@@ -0,0 +1,95 @@
+import json
+
+import numpy as np
+
+from services.geo_service import BlockLocator
+
+
+def _haversine_km(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = map(np.radians, (lat1, lng1, lat2, lng2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * 6371.0 * np.arcsin(np.sqrt(a))
+
+
+def test_nearest_uses_great_circle_not_degree_distance():
+    # At 30N block 2 is closer in degrees (0.45 vs 0.5) but block 1 is closer in km
+    locator = BlockLocator()
+    locator.build([
+        {"id": 1, "latitude": 30.0, "longitude": 75.5},
+        {"id": 2, "latitude": 30.45, "longitude": 75.0},
+    ])
+
+    match = locator.locate(30.0, 75.0)
+
+    assert match["id"] == 1
+    assert match["method"] == "nearest"
+
+
+def test_batch_lookup_matches_brute_force_and_respects_max_distance():
+    rng = np.random.default_rng(0)
+    records = [
+        {"id": i, "latitude": float(lat), "longitude": float(lng)}
+        for i, (lat, lng) in enumerate(zip(rng.uniform(20, 32, 300), rng.uniform(70, 84, 300)))
+    ]
+    locator = BlockLocator(max_distance_km=40)
+    locator.build(records)
+    lats, lngs = rng.uniform(18, 34, 500), rng.uniform(68, 86, 500)
+
+    results = locator.locate_many(lats, lngs)
+
+    centroid_lats = np.array([r["latitude"] for r in records])
+    centroid_lngs = np.array([r["longitude"] for r in records])
+    for lat, lng, result in zip(lats, lngs, results):
+        distances = _haversine_km(lat, lng, centroid_lats, centroid_lngs)
+        best = int(np.argmin(distances))
+        if distances[best] <= 40:
+            assert result["id"] == records[best]["id"]
+        else:
+            assert result is None
+
+
+def _square(block_id, west, south, east, north):
+    return {
+        "type": "Feature",
+        "properties": {"id": block_id},
+        "geometry": {
+            "type": "Polygon",
+            "coordinates": [[[west, south], [east, south], [east, north], [west, north], [west, south]]],
+        },
+    }
+
+
+def test_polygon_match_beats_nearer_centroid_and_covers_shared_edges(tmp_path):
+    # Block 1 spans 75-76E, block 2 spans 74-75E; their shared edge is 75E
+    boundaries = tmp_path / "blocks.geojson"
+    boundaries.write_text(json.dumps({
+        "type": "FeatureCollection",
+        "features": [_square(1, 75.0, 30.0, 76.0, 31.0), _square(2, 74.0, 30.0, 75.0, 31.0)],
+    }))
+    locator = BlockLocator()
+    locator.build(
+        [
+            {"id": 1, "latitude": 30.9, "longitude": 75.9},
+            {"id": 2, "latitude": 30.1, "longitude": 74.95},
+        ],
+        str(boundaries),
+    )
+
+    inside, edge, outside = locator.locate_many([30.1, 30.5, 29.9], [75.1, 75.0, 74.95])
+
+    # Inside block 1 even though block 2's centroid is much closer
+    assert inside == {"id": 1, "method": "polygon", "distance_km": 0.0}
+    assert edge["method"] == "polygon" and edge["id"] in (1, 2)
+    assert outside["method"] == "nearest" and outside["id"] == 2
+
+
+def test_nan_point_does_not_misalign_the_rest_of_the_batch():
+    locator = BlockLocator()
+    locator.build([
+        {"id": 1, "latitude": 30.0, "longitude": 75.0},
+        {"id": 2, "latitude": 31.0, "longitude": 76.0},
+    ])
+
+    results = locator.locate_many([30.01, float("nan"), 31.01], [75.01, 75.5, 76.01])
+
+    assert [r and r["id"] for r in results] == [1, None, 2]
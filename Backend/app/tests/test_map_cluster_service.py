@@ -0,0 +1,109 @@
+import numpy as np
+import pytest
+
+from services.map_cluster_service import MapClusterService, MapTooLargeError
+
+INDIA = (68.0, 8.0, 97.0, 35.0)
+
+
+def _records(ids, rng, spread=1.0):
+    risk_levels = ["Green", "Yellow", "Red"]
+    return [
+        {
+            "id": int(i),
+            "blockName": f"Block {i}",
+            "district": f"District {i % 7}",
+            "latitude": float(30.0 + rng.uniform(-spread, spread)),
+            "longitude": float(75.0 + rng.uniform(-spread, spread)),
+            "riskLevel": risk_levels[int(i) % 3],
+            "depthToWater": float(rng.uniform(2, 40)),
+            "stageOfExtraction": float(rng.uniform(20, 180)),
+            "rainfall": float(rng.uniform(200, 1200)),
+        }
+        for i in ids
+    ]
+
+
+def _assert_same_clusters(incremental, rebuilt):
+    assert incremental.cluster_max_zoom == rebuilt.cluster_max_zoom
+    for zoom in range(rebuilt.min_zoom, rebuilt.cluster_max_zoom + 1):
+        keys, values = incremental.grids[zoom]
+        expected_keys, expected_values = rebuilt.grids[zoom]
+        np.testing.assert_array_equal(keys, expected_keys)
+        np.testing.assert_allclose(values, expected_values, atol=1e-6)
+    for zoom in range(rebuilt.min_zoom, rebuilt.max_zoom + 1):
+        try:
+            expected = rebuilt.get_clusters(INDIA, zoom)
+        except MapTooLargeError:
+            continue
+        assert incremental.get_clusters(INDIA, zoom) == expected
+
+
+def test_incremental_updates_match_a_rebuild():
+    rng = np.random.default_rng(0)
+    # Start sparse, then grow densely so the clustered levels have to change
+    records = {r["id"]: r for r in _records(range(40), rng, spread=5.0)}
+    service = MapClusterService(max_features=100000)
+    service.build(records.values())
+    levels_before = service.cluster_max_zoom
+
+    for batch in range(5):
+        added = _records(range(100 + batch * 300, 100 + (batch + 1) * 300), rng, spread=0.3)
+        changed = _records(rng.choice(list(records), 5, replace=False), rng, spread=0.3)
+        for record in added + changed:
+            records[record["id"]] = record
+        service.upsert(added + changed)
+
+        removed = rng.choice(list(records), 20, replace=False).tolist()
+        for block_id in removed:
+            del records[block_id]
+        service.remove(removed)
+
+    rebuilt = MapClusterService(max_features=100000)
+    rebuilt.build(records.values())
+
+    assert rebuilt.cluster_max_zoom != levels_before
+    _assert_same_clusters(service, rebuilt)
+    assert service.get_clusters(INDIA, 0)["features"][0]["properties"]["pointCount"] == len(records)
+
+
+def test_removing_most_blocks_shrinks_levels_like_a_rebuild():
+    rng = np.random.default_rng(1)
+    dense = _records(range(1000), rng, spread=0.2)
+    sparse = _records(range(1000, 1030), rng, spread=6.0)
+    service = MapClusterService(max_features=100000)
+    service.build(dense + sparse)
+
+    service.remove(range(1000))
+
+    rebuilt = MapClusterService(max_features=100000)
+    rebuilt.build(sparse)
+    _assert_same_clusters(service, rebuilt)
+
+
+def test_etag_follows_the_data_not_the_process():
+    rng = np.random.default_rng(2)
+    records = _records(range(50), rng)
+    first, restarted = MapClusterService(), MapClusterService()
+    first.build(records)
+    restarted.build(records)
+    assert first.etag(INDIA, 5) == restarted.etag(INDIA, 5)
+
+    # A restart on changed data must not revalidate the old clusters
+    changed = [dict(records[0], depthToWater=99.0)] + records[1:]
+    restarted_on_new_data = MapClusterService()
+    restarted_on_new_data.build(changed)
+    assert first.etag(INDIA, 5) != restarted_on_new_data.etag(INDIA, 5)
+
+    before = first.etag(INDIA, 5)
+    first.upsert(changed[:1])
+    assert first.etag(INDIA, 5) != before
+
+
+def test_viewport_over_the_feature_cap_is_rejected():
+    rng = np.random.default_rng(3)
+    service = MapClusterService(max_features=10)
+    service.build(_records(range(200), rng, spread=3.0))
+
+    with pytest.raises(MapTooLargeError):
+        service.get_clusters(INDIA, service.max_zoom)
@@ -0,0 +1,103 @@
+import asyncio
+import time
+
+import pytest
+
+from services.profiling_service import ProfilingService, run_in_executor
+
+
+def _busy(seconds: float = 0.1):
+    end = time.time() + seconds
+    while time.time() < end:
+        sum(range(1000))
+
+
+def profiled_work():
+    _busy()
+
+
+def unrelated_work():
+    _busy()
+
+
+def test_enabling_without_admin_token_fails_closed():
+    with pytest.raises(ValueError):
+        ProfilingService(enabled=True)
+
+
+def test_header_trigger_requires_admin_token(tmp_path):
+    service = ProfilingService(enabled=True, profile_dir=str(tmp_path), admin_token="secret")
+
+    assert not service.should_profile({"x-profile": "1"})
+    assert not service.should_profile({"x-profile": "1", "x-admin-token": "wrong"})
+    assert service.should_profile({"x-profile": "1", "x-admin-token": "secret"})
+
+
+def test_only_one_profile_runs_at_a_time(tmp_path):
+    service = ProfilingService(enabled=True, profile_dir=str(tmp_path), admin_token="secret")
+
+    first = service.start()
+    assert service.start() is None
+    service.stop(first)
+
+    second = service.start()
+    assert second is not None
+    service.stop(second)
+
+
+def test_profile_only_samples_the_requests_executor_threads(tmp_path):
+    service = ProfilingService(enabled=True, profile_dir=str(tmp_path), admin_token="secret")
+
+    async def profiled_request():
+        sampler = service.start()
+
+        async def handler():
+            await run_in_executor(profiled_work)
+
+        await asyncio.create_task(handler())
+        service.stop(sampler)
+        return sampler
+
+    async def scenario():
+        other = asyncio.create_task(run_in_executor(unrelated_work))
+        sampler = await profiled_request()
+        await other
+        return sampler
+
+    collapsed = asyncio.run(scenario()).to_collapsed()
+
+    assert "profiled_work" in collapsed
+    assert "unrelated_work" not in collapsed
+
+
+def test_stop_and_save_run_off_the_event_loop(tmp_path):
+    service = ProfilingService(enabled=True, profile_dir=str(tmp_path), admin_token="secret")
+
+    async def scenario():
+        sampler = service.start()
+        stop = sampler.stop
+
+        def slow_stop():
+            time.sleep(0.2)
+            stop()
+
+        sampler.stop = slow_stop
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        await service.stop_async(sampler)
+        profile_id = await service.save_async(sampler, "GET", "/api/water-level", 200)
+        task.cancel()
+        return ticks, profile_id
+
+    ticks, profile_id = asyncio.run(scenario())
+
+    assert ticks >= 10
+    assert service.profile_path(profile_id, "speedscope") is not None
+    assert service.start() is not None
@@ -0,0 +1,68 @@
+from services.prompt_builder import PromptBuilder, QA_TEMPLATE
+
+
+def _record(block_id, name="Block"):
+    return {
+        "id": block_id,
+        "blockName": f"{name} {block_id}",
+        "district": "Amritsar District",
+        "state": "Punjab",
+        "rainfall": 409.14,
+        "groundwaterRecharge": 3548.56,
+        "annualExtractable": 3248.62,
+        "groundwaterExtraction": 2705.64,
+        "stageOfExtraction": 83.29,
+        "depthToWater": 11.34,
+        "riskLevel": "Red",
+    }
+
+
+def _rows(context):
+    return context.split("\n")[1:]
+
+
+def test_neighbours_are_deduplicated_and_capped():
+    builder = PromptBuilder(token_budget=10000, max_neighbours=2)
+    target = _record(1)
+    neighbours = [_record(1), _record(2), _record(2), _record(3), _record(4)]
+
+    inputs, stats = builder.build(target, neighbours, "question", "Hindi")
+
+    rows = _rows(inputs["context"])
+    assert [row.split("|")[0] for row in rows] == ["Block 1", "Block 2", "Block 3"]
+    assert stats["contextRecords"] == 3
+
+
+def test_neighbours_stop_at_the_token_budget():
+    # One token per character makes the budget arithmetic exact
+    builder = PromptBuilder(max_neighbours=5, count_tokens=len)
+    target, neighbours = _record(1), [_record(i) for i in range(2, 7)]
+    fixed = len(QA_TEMPLATE.format(context="", question="q", language_name="Hindi"))
+    header_and_target = len(builder.header + "\n" + builder.render_row(target))
+    row = len("\n" + builder.render_row(neighbours[0]))
+    builder.token_budget = fixed + header_and_target + 2 * row
+
+    inputs, stats = builder.build(target, neighbours, "q", "Hindi")
+
+    assert len(_rows(inputs["context"])) == 3
+    assert stats["estimatedPromptTokens"] <= builder.token_budget
+    assert stats["tokenBudget"] == builder.token_budget
+
+
+def test_target_is_kept_even_when_it_alone_exceeds_the_budget():
+    builder = PromptBuilder(token_budget=10)
+
+    inputs, stats = builder.build(_record(1), [_record(2)], "question", "Hindi")
+
+    assert _rows(inputs["context"]) == [builder.render_row(_record(1))]
+    assert stats["contextRecords"] == 1
+    assert stats["estimatedPromptTokens"] > stats["tokenBudget"]
+
+
+def test_rows_are_compact_and_escape_separators():
+    builder = PromptBuilder()
+    record = dict(_record(1), blockName="North|South", rainfall=400.0)
+
+    row = builder.render_row(record)
+
+    assert row.split("|")[:4] == ["North/South", "Amritsar", "Punjab", "400"]
@@ -0,0 +1,99 @@
+import hashlib
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from services.vector_store import NumpyVectorStore
+
+
+class FakeEmbeddings(Embeddings):
+    """Deterministic embeddings derived from a hash of the text"""
+
+    def _embed(self, text: str) -> List[float]:
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        return np.random.default_rng(seed).standard_normal(16).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+def _build(tmp_path, texts, quantize=False):
+    metadatas = [{"id": i, "state": "Punjab" if i % 2 else "Haryana"} for i in range(len(texts))]
+    return NumpyVectorStore.from_texts(
+        texts, FakeEmbeddings(), metadatas=metadatas,
+        persist_directory=str(tmp_path), collection_name="test", quantize=quantize
+    )
+
+
+def test_reopen_matching_index_loads_persisted_vectors(tmp_path):
+    texts = ["Amritsar Block 1", "Ludhiana Block 2", "Jaipur Block 3"]
+    built = _build(tmp_path, texts)
+    reopened = _build(tmp_path, texts)
+
+    assert reopened.texts == texts
+    assert isinstance(reopened.vectors, np.memmap)
+    assert np.allclose(np.asarray(reopened.vectors), built.vectors)
+
+
+def test_stale_index_is_rebuilt_not_appended(tmp_path):
+    _build(tmp_path, ["Old Block 1", "Old Block 2", "Old Block 3"])
+    new_texts = ["New Block 1", "New Block 2"]
+    store = _build(tmp_path, new_texts)
+
+    assert store.texts == new_texts
+    assert store.vectors.shape[0] == len(new_texts)
+    assert [m["id"] for m in store.metadatas] == [0, 1]
+
+    reopened = _build(tmp_path, new_texts)
+    assert reopened.texts == new_texts
+    assert reopened.vectors.shape[0] == len(new_texts)
+
+
+def test_search_ranks_exact_match_first_and_applies_filters(tmp_path):
+    texts = [f"Block {i}" for i in range(10)]
+    for quantize in (False, True):
+        store = _build(tmp_path / str(quantize), texts, quantize=quantize)
+        assert store.similarity_search("Block 3", k=1)[0].page_content == "Block 3"
+
+        docs = store.similarity_search("Block 3", k=10, filter={"state": "Haryana"})
+        assert len(docs) == 5
+        assert all(d.metadata["state"] == "Haryana" for d in docs)
+
+
+class OtherModelEmbeddings(FakeEmbeddings):
+    """Same texts, different model and vector width"""
+
+    model_name = "other-model"
+
+    def _embed(self, text: str) -> List[float]:
+        return super()._embed(text) + [0.0] * 8
+
+
+def test_changed_embedding_model_rebuilds_index(tmp_path):
+    texts = ["Amritsar Block 1", "Ludhiana Block 2"]
+    _build(tmp_path, texts)
+
+    store = NumpyVectorStore.from_texts(
+        texts, OtherModelEmbeddings(), metadatas=[{"id": 0, "state": "Haryana"}, {"id": 1, "state": "Punjab"}],
+        persist_directory=str(tmp_path), collection_name="test"
+    )
+
+    assert store.vectors.shape == (2, 24)
+    assert store.similarity_search("Ludhiana Block 2", k=1)[0].page_content == "Ludhiana Block 2"
+
+
+def test_partial_index_on_disk_is_rebuilt(tmp_path):
+    texts = ["Amritsar Block 1", "Ludhiana Block 2", "Jaipur Block 3"]
+    _build(tmp_path, texts, quantize=True)
+    (tmp_path / "test_scales.npy").unlink()
+    (tmp_path / "test.json").write_text('{"quantize": true, "texts": [')
+
+    store = _build(tmp_path, texts, quantize=True)
+
+    assert store.texts == texts
+    assert len(store.scales) == len(texts)
+    assert _build(tmp_path, texts, quantize=True).load()
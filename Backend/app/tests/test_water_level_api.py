@@ -0,0 +1,117 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from services.langchain_service import LangChainWaterSystem
+
+RECORD = {
+    "id": 7,
+    "blockName": "Amritsar Block 1",
+    "district": "Amritsar District",
+    "state": "Punjab",
+    "rainfall": 409.14,
+    "groundwaterRecharge": 3548.56,
+    "naturalDischarges": 299.94,
+    "annualExtractable": 3248.62,
+    "groundwaterExtraction": 2705.64,
+    "stageOfExtraction": 83.29,
+    "depthToWater": 11.34,
+    "riskLevel": "Red",
+    "latitude": 30.2215,
+    "longitude": 74.7288,
+    "lastUpdated": "2024-01-15",
+}
+
+
+class StubWaterSystem:
+    """Resolves every request to RECORD and counts analysis runs"""
+
+    analysis_etag = staticmethod(LangChainWaterSystem.analysis_etag)
+
+    def __init__(self, ai_generated=True):
+        self.ai_generated = ai_generated
+        self.analysis_calls = 0
+
+    async def resolve_block(self, location, latitude, longitude):
+        return dict(RECORD, similarity_score=1.0), "Coordinate lookup"
+
+    async def get_water_analysis(self, location, latitude, longitude, language="hi", resolved=None):
+        self.analysis_calls += 1
+        record, data_source = resolved
+        return {
+            **record,
+            "farmerMessage": "message",
+            "action": "action",
+            "explanation": "explanation",
+            "location": location,
+            "searchedLatitude": latitude,
+            "searchedLongitude": longitude,
+            "matchedLocation": f"{record['blockName']}, {record['district']}",
+            "confidenceScore": 1.0,
+            "dataSource": data_source,
+            "aiGenerated": self.ai_generated,
+        }
+
+
+@pytest.fixture
+def water_system(monkeypatch):
+    stub = StubWaterSystem()
+    monkeypatch.setattr(main, "water_system", stub)
+    return stub
+
+
+@pytest.fixture
+def client():
+    # Not used as a context manager, so the startup event (model loading) does not run
+    return TestClient(main.app)
+
+
+PARAMS = {"latitude": 30.2, "longitude": 74.7, "language": "hi"}
+
+
+def test_matching_if_none_match_returns_304_without_running_the_analysis(client, water_system):
+    first = client.get("/api/water-level", params=PARAMS)
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+
+    second = client.get("/api/water-level", params=PARAMS, headers={"If-None-Match": f'W/"other", {etag}'})
+
+    assert second.status_code == 304
+    assert second.headers["etag"] == etag
+    assert water_system.analysis_calls == 1
+
+
+def test_post_never_returns_304(client, water_system):
+    etag = client.get("/api/water-level", params=PARAMS).headers["etag"]
+
+    response = client.post("/api/water-level", json=PARAMS, headers={"If-None-Match": etag})
+
+    assert response.status_code == 200
+    assert response.json()["data"]["blockName"] == RECORD["blockName"]
+    assert water_system.analysis_calls == 2
+
+
+def test_fields_projection_and_unknown_fields(client, water_system):
+    response = client.get("/api/water-level", params=dict(PARAMS, fields="riskLevel,farmerMessage"))
+    assert response.status_code == 200
+    assert response.json()["data"] == {"riskLevel": "Red", "farmerMessage": "message"}
+
+    response = client.get("/api/water-level", params=dict(PARAMS, fields="riskLevel,bogus"))
+    assert response.status_code == 400
+    assert water_system.analysis_calls == 1
+
+
+def test_fallback_insights_are_not_cached(client, water_system):
+    water_system.ai_generated = False
+
+    response = client.get("/api/water-level", params=PARAMS)
+
+    assert response.status_code == 200
+    assert "etag" not in response.headers
+    assert response.headers["cache-control"] == "no-store"
+
+
+def test_out_of_range_coordinates_are_rejected(client, water_system):
+    assert client.get("/api/water-level", params=dict(PARAMS, latitude="nan")).status_code == 422
+    assert client.post("/api/blocks/locate", json={"points": [{"latitude": 91, "longitude": 75}]}).status_code == 422
+    assert water_system.analysis_calls == 0
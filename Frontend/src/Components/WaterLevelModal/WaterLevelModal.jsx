@@ -184,18 +184,15 @@ const WaterLevelModal = ({ onClose }) => {
     setIsLoading(true);
     
     try {
-      const response = await fetch('http://localhost:8000/api/water-level', {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify({
-          location: location,
-          latitude: coordinates.lat,
-          longitude: coordinates.lng,
-          language: selectedLanguage
-        })
+      // Conditional GET: the browser revalidates with the ETag, so repeat views
+      // of the same block are answered with 304 without rerunning the analysis
+      const params = new URLSearchParams({
+        location: location,
+        latitude: coordinates.lat,
+        longitude: coordinates.lng,
+        language: selectedLanguage
       });
+      const response = await fetch(`http://localhost:8000/api/water-level?${params}`);
 
       if (!response.ok) throw new Error('API request failed');
       